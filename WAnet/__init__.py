@@ -1,4 +1,17 @@
-import WAnet.training
-import WAnet.preprocessing
-import WAnet.showing
-import WAnet.application
+import importlib
+
+# Submodules are imported on first use, so that "import WAnet" stays cheap for scripts that only need openwec or
+# voxels, and keras, matplotlib and scipy load only when something uses them
+SUBMODULES = ('voxels', 'metrics', 'training', 'preprocessing', 'showing', 'application', 'optimizing', 'indexing',
+              'evaluating', 'sampling', 'benchmarking', 'reporting', 'inference', 'quantizing', 'generating', 'meshing',
+              'fitting', 'openwec')
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module('WAnet.'+name)
+    raise AttributeError("module 'WAnet' has no attribute "+repr(name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(SUBMODULES))
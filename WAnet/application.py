@@ -1,6 +1,28 @@
 import keras
 import WAnet.training
+import WAnet.voxels
 import numpy
+import os
+import pkg_resources
+
+
+def _with_mask(network, weights):
+    # Models trained on the active voxels only are handed out working on full grids
+    mask = weights[:-len('_weights.h5')]+'_mask.npz'
+    if os.path.exists(mask):
+        return WAnet.voxels.MaskedModel(network, WAnet.voxels.load_mask(mask))
+    return network
+
+
+def load_model(case):
+    # Load a saved model by its trained_models prefix, e.g. "16geometry_decoder"
+    structure = pkg_resources.resource_filename("WAnet", "trained_models/"+case+"_structure.yml")
+    weights = pkg_resources.resource_filename("WAnet", "trained_models/"+case+"_weights.h5")
+    with open(structure, 'r') as file:
+        network = keras.models.model_from_yaml(file.read())
+        network.load_weights(weights)
+
+    return _with_mask(network, weights)
 
 
 class Network(object):
@@ -21,12 +43,13 @@ class Network(object):
         with open(structure, 'r') as file:
             self.network = keras.models.model_from_yaml(file.read())
             self.network.load_weights(weights)
+        self.network = _with_mask(self.network, weights)
 
         # Load data
         self._load_data()
 
     def _load_data(self):
-        self.curves, self.geometry, self.S, self.N, self.D, self.F, self.G, self.new_curves, self.new_geometry = WAnet.training.load_data()
+        self.curves, self.geometry, self.S, self.N, self.D, self.F, self.G, self.new_curves, self.new_geometry = WAnet.training.load_data(packed=True)
 
     def prediction(self, idx=None):
 
@@ -35,17 +58,17 @@ class Network(object):
             print(idx)
 
         # Get the input
-        if self.network.layers[0].input_shape[1] == pow(self.G, 3):
-            data_input = self.new_geometry[idx:(idx+1), :]
+        if self.network.input_shape[1] == pow(self.G, 3):
+            data_input = WAnet.training.dense(self.new_geometry[idx:(idx+1), :])
             other_data_input = data_input.reshape((self.G, self.G, self.G), order='F')
         else:
-            data_input = self.new_curves[idx:(idx+1), :]
+            data_input = WAnet.training.dense(self.new_curves[idx:(idx+1), :])
             other_data_input = data_input.reshape((3, self.F))
 
         # Get the outputs
         predicted_output = self.network.predict(data_input)
-        if self.network.layers[-1].output_shape[1] == pow(self.G, 3):
-            true_output = self.new_geometry[idx].reshape((self.G, self.G, self.G), order='F')
+        if self.network.output_shape[1] == pow(self.G, 3):
+            true_output = self.new_geometry[idx].unpack()[0].reshape((self.G, self.G, self.G), order='F')
             predicted_output = predicted_output.reshape((self.G, self.G, self.G), order='F')
         else:
             true_output = self.new_curves[idx].reshape((3, self.F))
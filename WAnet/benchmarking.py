@@ -0,0 +1,277 @@
+import WAnet.openwec
+import WAnet.preprocessing
+import WAnet.voxels
+import argparse
+import datetime
+import json
+import numpy
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+GROUPS = ('imports', 'parsing', 'voxelize', 'load_data', 'openwec', 'training', 'inference')
+
+# What the mesh workers, the NumPy runtime and the trainers each pull in
+IMPORTS = ('WAnet', 'WAnet.openwec', 'WAnet.voxels', 'WAnet.preprocessing', 'WAnet.inference', 'WAnet.training')
+
+
+def write_case(case_dir, shape, dimensions, F=64, random=numpy.random):
+    # A case directory laid out like NEMOH_data, with the vertices of the openwec body and made-up forces
+    body = getattr(WAnet.openwec, shape)(*dimensions, [0, 0, 0])
+    os.makedirs(case_dir)
+    with open(os.path.join(case_dir, 'axisym.dat'), 'w') as fid:
+        fid.write('          2          0\n')
+        for i in range(len(body.X)):
+            fid.write('{:14d}{:24.7f}{:24.7f}{:24.7f}\n'.format(i + 1, body.X[i], body.Y[i], body.Z[i]))
+        fid.write('             0              0.00              0.00              0.00\n')
+
+    with open(os.path.join(case_dir, 'ExcitationForce.tec'), 'w') as fid:
+        fid.write('VARIABLES="w (rad/s)"\n')
+        for dof in range(1, 4):
+            fid.write('"abs(F   1   {0:d})" "angle(F   1   {0:d})"\n'.format(dof))
+        fid.write('Zone t="Diffraction force - beta =   0.000 deg",I=    {:d},F=POINT\n'.format(F))
+        for w in numpy.linspace(0.05, 2.0, F):
+            row = [w] + list(random.uniform(0, 1e6, 6))
+            fid.write(''.join('  {:.7E}'.format(value) for value in row) + '\n')
+
+
+def write_cases(directory, cases, F=64, random=numpy.random):
+    # Random shapes inside the limits used by preprocessing.generate_data
+    shapes = list(WAnet.preprocessing.GEOMETRIES)
+    case_dirs = []
+    for i in range(cases):
+        shape = shapes[i % len(shapes)]
+        limits = WAnet.preprocessing.GEOMETRIES[shape]["vars"].values()
+        case_dirs.append(os.path.join(directory, shape + str(i).zfill(3)))
+        write_case(case_dirs[-1], shape, [random.uniform(low, high) for low, high in limits], F, random)
+
+    return case_dirs
+
+
+def write_compiled_data(directory, cases, G=32, F=64, random=numpy.random):
+    # Files in the format extract_data writes, for training.load_data
+    S = len(WAnet.preprocessing.GEOMETRIES)
+    D = 3
+    N = max(cases // S, 1)
+    os.makedirs(directory)
+    geometry = random.random_sample((S * N, G * G * G)) > 0.8
+    WAnet.voxels.PackedVoxels.from_dense(geometry, G).save(os.path.join(directory, 'data_geometry.npz'))
+    numpy.savez(os.path.join(directory, 'data_curves.npz'), curves=random.uniform(0, 1e6, (S * N, F, D)),
+                names=numpy.array(['case' + str(i) for i in range(S * N)]))
+    numpy.savez(os.path.join(directory, 'constants.npz'), S=S, N=N, D=D, F=F, G=G)
+
+
+def measure(function, rounds):
+    times = []
+    for i in range(rounds):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+
+    times = numpy.array(times)
+    return {'min': times.min(), 'max': times.max(), 'mean': times.mean(),
+            'stddev': times.std(ddof=1) if len(times) > 1 else 0.0, 'median': numpy.median(times),
+            'rounds': rounds, 'ops': 1.0 / times.mean(), 'data': times.tolist()}
+
+
+def _cycle(function, items):
+    # Each call handles the next item, so rounds spread over the synthetic cases
+    state = {'i': 0}
+
+    def call():
+        function(items[state['i'] % len(items)])
+        state['i'] += 1
+    return call
+
+
+def _imports(settings):
+    # Each import in a fresh interpreter, since a module is only ever imported once per process
+    return [('import[' + module + ']',
+             lambda module=module: subprocess.check_call([sys.executable, '-c', 'import ' + module]))
+            for module in IMPORTS]
+
+
+def _parsing(case_dirs, settings):
+    return [('read_excitation_force', _cycle(WAnet.preprocessing.read_excitation_force, case_dirs)),
+            ('read_vertices', _cycle(WAnet.preprocessing.read_vertices, case_dirs))]
+
+
+def _voxelize(case_dirs, settings):
+    vertices = [WAnet.preprocessing.read_vertices(case_dir) for case_dir in case_dirs]
+    return [('voxelize_vertices[G='+str(settings['G'])+']',
+             _cycle(lambda v: WAnet.preprocessing.voxelize_vertices(v, settings['G']), vertices))]
+
+
+def _load_data(compiled, settings):
+    import WAnet.training
+    return [('load_data[packed]', lambda: WAnet.training.load_data(packed=True, directory=compiled)),
+            ('load_data[dense]', lambda: WAnet.training.load_data(packed=False, directory=compiled))]
+
+
+def _openwec(settings):
+    return [('openwec.' + shape, lambda shape=shape: getattr(WAnet.openwec, shape)(
+        *[numpy.mean(limits) for limits in WAnet.preprocessing.GEOMETRIES[shape]["vars"].values()], [0, 0, 0]))
+        for shape in WAnet.preprocessing.GEOMETRIES]
+
+
+def _models(compiled, settings):
+    # Every trained model of the pipeline, wired together as the train_* functions do, with its data
+    import WAnet.training
+    curves, geometry, S, N, D, F, G, new_curves, new_geometry = WAnet.training.load_data(packed=True,
+                                                                                         directory=compiled)
+    latent_dim = settings['latent_dim']
+    geometry_vae, geometry_models = WAnet.training.build_geometry_vae(latent_dim, G)
+    curve_vae, curve_models = WAnet.training.build_response_vae(latent_dim, D, F)
+    geometry_models = dict(geometry_models)
+    curve_models = dict(curve_models)
+    forward = WAnet.training.build_forward_network(latent_dim, G, D, F, geometry_models['geometry_encoder'],
+                                                   curve_models['curve_decoder'])[0]
+    inverse = WAnet.training.build_inverse_network(latent_dim, G, D, F, geometry_models['geometry_decoder'],
+                                                   curve_models['curve_encoder'])[0]
+
+    # Same batch sizes as the trainers
+    return [('geometry_vae', geometry_vae, new_geometry, None, 100, True),
+            ('curve_vae', curve_vae, new_curves, None, 10, True),
+            ('forward', forward, new_geometry, new_curves, 32, False),
+            ('inverse', inverse, new_curves, new_geometry, 32, False),
+            ('simple_forward', WAnet.training.build_simple_forward_network(G, D, F)[0], new_geometry, new_curves, 32,
+             False),
+            ('simple_inverse', WAnet.training.build_simple_inverse_network(G, D, F)[0], new_curves, new_geometry, 32,
+             False)]
+
+
+def _training(compiled, settings):
+    import WAnet.training
+
+    def epoch(model, x, y, batch_size, shuffle):
+        model.fit_generator(WAnet.training.VoxelSequence(x, y, batch_size, shuffle), epochs=1, verbose=0)
+
+    return [('epoch[' + name + ']', lambda args=args: epoch(*args)) for name, *args in _models(compiled, settings)]
+
+
+def _inference(compiled, settings):
+    # What application.Network.prediction does per call, against whole test sets
+    import WAnet.training
+    benchmarks = []
+    for name, model, x, y, batch_size, shuffle in _models(compiled, settings):
+        if name in ('forward', 'inverse'):
+            single = WAnet.training.dense(x[0:1])
+            benchmarks.append(('predict[' + name + ', single]', lambda model=model, single=single: model.predict(single)))
+            benchmarks.append(('predict[' + name + ', batched]', lambda model=model, x=x: [
+                model.predict(batch, batch_size=len(batch)) for batch in WAnet.voxels.batches(x, 1000, numpy.float32)]))
+    return benchmarks
+
+
+def run(groups=GROUPS, cases=50, G=32, latent_dim=4, rounds=5, seed=0):
+    settings = {'cases': cases, 'G': G, 'latent_dim': latent_dim, 'rounds': rounds, 'seed': seed}
+    random = numpy.random.RandomState(seed)
+    directory = tempfile.mkdtemp()
+    try:
+        case_dirs = write_cases(os.path.join(directory, 'NEMOH_data'), cases, random=random)
+        compiled = os.path.join(directory, 'compiled_data')
+        write_compiled_data(compiled, cases, G, random=random)
+
+        benchmarks = []
+        for group in groups:
+            if group == 'imports':
+                functions = _imports(settings)
+            elif group == 'parsing':
+                functions = _parsing(case_dirs, settings)
+            elif group == 'voxelize':
+                functions = _voxelize(case_dirs, settings)
+            elif group == 'load_data':
+                functions = _load_data(compiled, settings)
+            elif group == 'openwec':
+                functions = _openwec(settings)
+            elif group == 'training':
+                functions = _training(compiled, settings)
+            elif group == 'inference':
+                functions = _inference(compiled, settings)
+            else:
+                raise ValueError("Unknown benchmark group "+str(group)+", expected one of "+str(GROUPS))
+
+            for name, function in functions:
+                benchmarks.append({'group': group, 'name': name, 'stats': measure(function, rounds)})
+    finally:
+        shutil.rmtree(directory)
+
+    return {'machine_info': {'node': platform.node(), 'processor': platform.processor(),
+                             'machine': platform.machine(), 'python_version': platform.python_version(),
+                             'numpy_version': numpy.__version__},
+            'datetime': datetime.datetime.now().isoformat(),
+            'settings': settings,
+            'benchmarks': benchmarks}
+
+
+def table(results):
+    # One block per group, in the layout of pytest-benchmark
+    columns = ('min', 'max', 'mean', 'stddev', 'median')
+    lines = []
+    for group in GROUPS:
+        rows = [benchmark for benchmark in results['benchmarks'] if benchmark['group'] == group]
+        if not rows:
+            continue
+        width = max(len('Name (time in ms)'), max(len(row['name']) for row in rows))
+        title = " benchmark '" + group + "': " + str(len(rows)) + " tests "
+        lines.append(title.center(width + 12 * len(columns) + 8, '-'))
+        lines.append('Name (time in ms)'.ljust(width) + ''.join(column.title().rjust(12) for column in columns) +
+                     'Rounds'.rjust(8))
+        for row in sorted(rows, key=lambda row: row['stats']['mean']):
+            lines.append(row['name'].ljust(width) +
+                         ''.join('{:12.4f}'.format(1000 * row['stats'][column]) for column in columns) +
+                         '{:8d}'.format(row['stats']['rounds']))
+        lines.append('')
+
+    return '\n'.join(lines)
+
+
+def compare(results, baseline, tolerance=0.2):
+    # Benchmarks whose mean is more than tolerance slower than the saved baseline
+    previous = {(benchmark['group'], benchmark['name']): benchmark['stats']['mean'] for benchmark in baseline['benchmarks']}
+    regressions = []
+    for benchmark in results['benchmarks']:
+        key = (benchmark['group'], benchmark['name'])
+        if key in previous and benchmark['stats']['mean'] > (1 + tolerance) * previous[key]:
+            regressions.append((benchmark['name'], benchmark['stats']['mean'], previous[key]))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the WAnet pipeline on synthetic data.')
+    parser.add_argument('--groups', default=','.join(GROUPS), help='comma separated subset of ' + ','.join(GROUPS))
+    parser.add_argument('--cases', type=int, default=50, help='number of synthetic cases')
+    parser.add_argument('--G', type=int, default=32, help='voxel resolution')
+    parser.add_argument('--latent-dim', type=int, default=4, help='latent size of the trained models')
+    parser.add_argument('--rounds', type=int, default=5, help='timed calls per benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write the results to this JSON file, to serve as a baseline')
+    parser.add_argument('--compare', help='baseline JSON file to check the results against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown of the mean against the baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.groups.split(','), args.cases, args.G, args.latent_dim, args.rounds, args.seed)
+    print(table(results))
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for name, mean, previous in regressions:
+            print("Regression in " + name + ": " + '{:.4f}'.format(1000 * mean) + " ms against " +
+                  '{:.4f}'.format(1000 * previous) + " ms")
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
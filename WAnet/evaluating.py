@@ -0,0 +1,78 @@
+import WAnet.preprocessing
+import WAnet.voxels
+import numpy
+
+
+class HybridEvaluator(object):
+
+    def __init__(self, latent_dims=(2, 4, 8, 16, 32), autoencoder_dim=None, spread_tolerance=0.01,
+                 reconstruction_tolerance=None, forward=None, autoencoder=None):
+        # Forward networks of several latent sizes act as an ensemble. The trained models of latent_dims and
+        # autoencoder_dim are loaded unless forward and autoencoder are given.
+        if forward is None or (autoencoder is None and autoencoder_dim is not None):
+            import WAnet.application
+        self.latent_dims = latent_dims
+        if forward is None:
+            forward = [WAnet.application.load_model(str(latent_dim)+'forward') for latent_dim in latent_dims]
+        self.forward = forward
+        self.G = int(round(self.forward[0].input_shape[1] ** (1.0 / 3)))
+
+        # The geometry autoencoder flags shapes unlike anything in the training data
+        if autoencoder is None and autoencoder_dim is not None:
+            autoencoder = WAnet.application.load_model(str(autoencoder_dim)+'geometry_autoencoder')
+        self.autoencoder = autoencoder
+
+        self.spread_tolerance = spread_tolerance
+        self.reconstruction_tolerance = reconstruction_tolerance
+
+    def score(self, geometry, batch_size=1000):
+        # Mean and spread of the ensemble, plus the reconstruction error of each geometry
+        curves = []
+        spread = []
+        reconstruction = []
+        for batch in WAnet.voxels.batches(geometry, batch_size):
+            predictions = numpy.array([network.predict(batch, batch_size=batch_size) for network in self.forward])
+            curves.append(numpy.mean(predictions, axis=0))
+            spread.append(numpy.mean(numpy.std(predictions, axis=0), axis=1))
+
+            if self.autoencoder is not None:
+                x_pred = numpy.clip(self.autoencoder.predict(batch, batch_size=batch_size), 1e-7, 1 - 1e-7)
+                reconstruction.append(-numpy.mean(batch * numpy.log(x_pred) + (1 - batch) * numpy.log(1 - x_pred), axis=1))
+            else:
+                reconstruction.append(numpy.zeros(len(batch)))
+
+        return numpy.vstack(curves), numpy.concatenate(spread), numpy.concatenate(reconstruction)
+
+    def uncertain(self, spread, reconstruction):
+        flags = numpy.zeros(len(spread), dtype=bool)
+        if self.spread_tolerance is not None:
+            flags |= spread > self.spread_tolerance
+        if self.reconstruction_tolerance is not None:
+            flags |= reconstruction > self.reconstruction_tolerance
+
+        return flags
+
+    def evaluate(self, candidates, solve=True, batch_size=1000):
+        # Candidates are (shape, dimensions) pairs or openwec meshes, as for preprocessing.voxelize_batch. Meshes are
+        # voxelized as the convex hull of their vertices, like the NEMOH corpus, so non-convex meshes are scored as
+        # their hull while NEMOH solves the mesh itself.
+        geometry = WAnet.preprocessing.voxelize_batch(candidates, self.G, packed=True)
+        curves, spread, reconstruction = self.score(geometry, batch_size)
+        flags = self.uncertain(spread, reconstruction)
+
+        # Fall back to NEMOH for the candidates the surrogates are unsure about, adding them to the corpus
+        case_dirs = [None] * len(candidates)
+        if solve:
+            for i in numpy.nonzero(flags)[0]:
+                candidate = candidates[i]
+                if isinstance(candidate, (tuple, list)):
+                    case_dirs[i] = WAnet.preprocessing.new_case_dir(candidate[0])
+                    WAnet.preprocessing.solve_shape(candidate[0], candidate[1], case_dirs[i])
+                else:
+                    case_dirs[i] = WAnet.preprocessing.new_case_dir('mesh')
+                    WAnet.preprocessing.solve_mesh(candidate, case_dirs[i])
+
+                # Same layout and scaling as new_curves in training.load_data
+                curves[i, :] = WAnet.preprocessing.read_excitation_force(case_dirs[i]).T.flatten() / 1000000
+
+        return curves, spread, reconstruction, flags, case_dirs
@@ -0,0 +1,152 @@
+import WAnet.preprocessing
+import WAnet.voxels
+import hashlib
+import itertools
+import json
+import numpy
+import os
+import pkg_resources
+
+
+def parameter_lattice(steps=8):
+    # Every shape at steps values of each of its dimensions, inside the limits used by preprocessing.generate_data
+    candidates = []
+    for shape in WAnet.preprocessing.GEOMETRIES:
+        axes = [numpy.linspace(low, high, steps) for low, high in WAnet.preprocessing.GEOMETRIES[shape]["vars"].values()]
+        candidates.extend((shape, [float(value) for value in dimensions]) for dimensions in itertools.product(*axes))
+
+    return candidates
+
+
+def lattice_key(candidates, G):
+    # Changes with the limits of preprocessing.GEOMETRIES and the steps, which set the candidates, and with G
+    description = json.dumps([G, candidates], sort_keys=True)
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()[:12]
+
+
+def _stale(candidates, signatures, G, checks=3):
+    # A cache of another lattice, or voxelized by an older voxelizer, which a few rows voxelized again would show
+    if len(signatures) != len(candidates) or signatures.G != G:
+        return True
+    rows = numpy.unique(numpy.linspace(0, len(candidates) - 1, checks).astype(int))
+    voxels = WAnet.preprocessing.voxelize_batch([candidates[i] for i in rows], G, packed=True)
+    return bool(numpy.any(signatures[rows].packed != voxels.packed))
+
+
+def load_lattice(steps=8, G=32, directory=None):
+    # Occupancy signatures of the lattice, voxelized once and kept with the compiled data
+    if directory is None:
+        directory = pkg_resources.resource_filename('WAnet', 'data/compiled_data')
+    candidates = parameter_lattice(steps)
+    filename = os.path.join(directory, 'shape_lattice_'+str(steps)+'_'+str(G)+'_'+lattice_key(candidates, G)+'.npz')
+    signatures = WAnet.voxels.load(filename) if os.path.exists(filename) else None
+    if signatures is None or _stale(candidates, signatures, G):
+        signatures = WAnet.preprocessing.voxelize_batch(candidates, G, packed=True)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        signatures.save(filename)
+
+    return candidates, signatures
+
+
+def similarity(voxels, signatures, metric='iou', batch_size=1000):
+    # IoU, or minus the Hamming distance, of every row of voxels against every signature, so that higher is closer.
+    # Overlaps of 0/1 rows are a matrix product, done a block of signatures at a time.
+    voxels = numpy.asarray(voxels, dtype=numpy.float32)
+    counts = numpy.sum(voxels, axis=1)[:, None]
+    scores = []
+    for block in WAnet.voxels.batches(signatures, batch_size, numpy.float32):
+        overlap = numpy.dot(voxels, block.T)
+        union = counts + numpy.sum(block, axis=1)[None, :] - overlap
+        if metric == 'iou':
+            scores.append(overlap / numpy.maximum(union, 1))
+        elif metric == 'hamming':
+            scores.append(overlap - union)
+        else:
+            raise ValueError("Unknown metric "+str(metric)+", expected 'iou' or 'hamming'")
+
+    return numpy.hstack(scores)
+
+
+def refine(voxels, shape, dimensions, G=32, metric='iou', step=0.5, iterations=20):
+    # Pattern search on the dimensions, starting at a lattice point, with steps as a fraction of the lattice spacing.
+    # The trials of a step are voxelized and scored as one batch, and the search stops once every step is below a
+    # quarter of a voxel, where moves hardly change the occupancy.
+    limits = list(WAnet.preprocessing.GEOMETRIES[shape]["vars"].values())
+    dimensions = list(dimensions)
+    steps = [step * (high - low) for low, high in limits]
+    scored = {}
+
+    def score(trials):
+        new = [trial for trial in set(map(tuple, trials)) if trial not in scored]
+        if new:
+            signatures = WAnet.preprocessing.voxelize_batch([(shape, list(trial)) for trial in new], G)
+            scored.update(zip(new, similarity(voxels[None, :], signatures, metric)[0]))
+        return [scored[tuple(trial)] for trial in trials]
+
+    best = score([dimensions])[0]
+    for iteration in range(iterations):
+        if max(steps) < 2.5 / G:
+            break
+        trials = []
+        for i, (low, high) in enumerate(limits):
+            for sign in (-1, 1):
+                trial = list(dimensions)
+                trial[i] = min(max(trial[i] + sign * steps[i], low), high)
+                if trial != dimensions:
+                    trials.append(trial)
+        scores = score(trials) if trials else []
+        if scores and max(scores) > best:
+            best = max(scores)
+            dimensions = trials[int(numpy.argmax(scores))]
+        else:
+            steps = [s / 2 for s in steps]
+
+    return dimensions, best
+
+
+class ShapeFitter(object):
+
+    def __init__(self, steps=8, G=32, metric='iou', threshold=0.51, directory=None):
+        # Closest primitive of generate_data, with its dimensions, to geometry such as inverse network predictions
+        self.steps = steps
+        self.G = G
+        self.metric = metric
+        self.threshold = threshold
+        self.candidates, self.signatures = load_lattice(steps, G, directory)
+
+    def match(self, geometry, top=1, batch_size=1000):
+        # Indices into the lattice of the top closest candidates of every row, and their scores
+        indices = []
+        scores = []
+        for batch in WAnet.voxels.batches(geometry, batch_size, numpy.float32):
+            similarities = similarity(numpy.asarray(batch) > self.threshold, self.signatures, self.metric)
+            order = numpy.argsort(-similarities, axis=1)[:, :top]
+            indices.append(order)
+            scores.append(numpy.take_along_axis(similarities, order, axis=1))
+
+        return numpy.vstack(indices), numpy.vstack(scores)
+
+    def fit(self, geometry, refine_fits=True, iterations=20, families=1, batch_size=1000):
+        # (shape, dimensions, score) for every row of geometry, dense or PackedVoxels. The best lattice point of each
+        # of the top families is refined and the best kept. Coarse lattices can rank the wrong family first, which
+        # more families make up for at the cost of a refinement each.
+        indices, scores = self.match(geometry, len(self.candidates), batch_size)
+        fits = []
+        for row in range(len(indices)):
+            starts = []
+            for i, score in zip(indices[row], scores[row]):
+                if self.candidates[i][0] not in [shape for shape, dimensions, best in starts]:
+                    starts.append(self.candidates[i] + (float(score),))
+                if len(starts) == (families if refine_fits else 1):
+                    break
+
+            if refine_fits:
+                voxels = numpy.asarray(geometry[row:(row + 1)], dtype=numpy.float32)[0] > self.threshold
+                starts = [(shape,) + refine(voxels, shape, dimensions, self.G, self.metric,
+                                            0.5 / max(self.steps - 1, 1), iterations)
+                          for shape, dimensions, best in starts]
+            shape, dimensions, score = max(starts, key=lambda start: start[2])
+            fits.append((shape, dimensions, float(score)))
+
+        return fits
@@ -0,0 +1,68 @@
+import WAnet.voxels
+import numpy
+
+
+def load_model(case, backend='numpy'):
+    # The NumPy runtime starts in milliseconds, keras is needed for convolutional autoencoders
+    if backend == 'numpy':
+        import WAnet.inference
+        return WAnet.inference.load_model(case)
+    if backend == 'keras':
+        import WAnet.application
+        return WAnet.application.load_model(case)
+    raise ValueError("Unknown backend "+str(backend)+", expected 'numpy' or 'keras'")
+
+
+def prior_latents(number, latent_dim, batch_size=1000, random=numpy.random):
+    # Draws from the standard normal prior of the variational autoencoder
+    for i in range(0, number, batch_size):
+        yield random.standard_normal((min(batch_size, number - i), latent_dim))
+
+
+def grid_latents(latent_dim, steps=10, limits=(-3.0, 3.0), batch_size=1000):
+    # Every point of a regular grid with steps points per latent dimension, built a batch at a time
+    axis = numpy.linspace(limits[0], limits[1], steps)
+    number = steps ** latent_dim
+    for i in range(0, number, batch_size):
+        indices = numpy.unravel_index(numpy.arange(i, min(i + batch_size, number)), (steps,) * latent_dim)
+        yield axis[numpy.stack(indices, axis=1)]
+
+
+def interpolation_latents(start, end, steps=10, batch_size=1000):
+    # Straight paths from each row of start to the same row of end, steps points each, path after path
+    start = numpy.atleast_2d(start)
+    end = numpy.atleast_2d(end)
+    t = numpy.linspace(0, 1, steps)[:, None]
+    latents = numpy.concatenate([a + t * (b - a) for a, b in zip(start, end)])
+    for i in range(0, len(latents), batch_size):
+        yield latents[i:(i + batch_size)]
+
+
+def encode(geometry, latent_dim, backend='numpy', batch_size=1000):
+    # Latent means of geometry in the new_geometry layout, packed or not, to interpolate between known cases
+    encoder = load_model(str(latent_dim)+'geometry_encoder', backend)
+    return numpy.vstack([encoder.predict(batch) for batch in WAnet.voxels.batches(geometry, batch_size, numpy.float32)])
+
+
+def decode(latents, decoder, threshold=0.51, packed=True):
+    # Decodes batches of latents and thresholds them like plot_voxels, yielding (latents, voxels) per batch with
+    # voxels as PackedVoxels or boolean rows in the new_geometry layout
+    G = int(round(decoder.output_shape[1] ** (1.0 / 3)))
+    for batch in latents:
+        voxels = decoder.predict(batch, batch_size=len(batch)) > threshold
+        yield batch, WAnet.voxels.PackedVoxels.from_dense(voxels, G) if packed else voxels
+
+
+def generate(latent_dim, number=1000, mode='prior', steps=10, limits=(-3.0, 3.0), start=None, end=None,
+             threshold=0.51, batch_size=1000, packed=True, backend='numpy', seed=None):
+    # Streams geometries decoded from the latent space, mode being 'prior', 'grid' or 'interpolation'
+    if mode == 'prior':
+        latents = prior_latents(number, latent_dim, batch_size, numpy.random.RandomState(seed))
+    elif mode == 'grid':
+        latents = grid_latents(latent_dim, steps, limits, batch_size)
+    elif mode == 'interpolation':
+        latents = interpolation_latents(start, end, steps, batch_size)
+    else:
+        raise ValueError("Unknown mode "+str(mode)+", expected 'prior', 'grid' or 'interpolation'")
+
+    return decode(latents, load_model(str(latent_dim)+'geometry_decoder', backend), threshold, packed)
@@ -0,0 +1,112 @@
+import WAnet.voxels
+import numpy
+import os
+import pkg_resources
+import sklearn.neighbors
+
+
+class LatentIndex(object):
+
+    def __init__(self, latent_dim, leaf_size=40, rebuild_fraction=0.1, directory=None):
+        # Instantiate variables
+        if directory is None:
+            directory = pkg_resources.resource_filename('WAnet', 'data/compiled_data')
+        self.latent_dim = latent_dim
+        self.directory = directory
+        self.leaf_size = leaf_size
+        self.rebuild_fraction = rebuild_fraction
+        self.names = numpy.empty(0, dtype=str)
+        self.curves = numpy.empty((0, 0))
+        self.geometry_latents = numpy.empty((0, latent_dim))
+        self.curve_latents = numpy.empty((0, latent_dim))
+        self.indexed = 0
+        self.geometry_tree = None
+        self.curve_tree = None
+        self.geometry_encoder = None
+        self.curve_encoder = None
+
+    def _path(self):
+        return os.path.join(self.directory, str(self.latent_dim)+'latent_index.npz')
+
+    def _load_encoders(self):
+        if self.geometry_encoder is None:
+            import WAnet.application
+            self.geometry_encoder = WAnet.application.load_model(str(self.latent_dim)+'geometry_encoder')
+            self.curve_encoder = WAnet.application.load_model(str(self.latent_dim)+'curve_encoder')
+
+    def _rebuild(self):
+        self.geometry_tree = sklearn.neighbors.KDTree(self.geometry_latents, leaf_size=self.leaf_size)
+        self.curve_tree = sklearn.neighbors.KDTree(self.curve_latents, leaf_size=self.leaf_size)
+        self.indexed = len(self.names)
+
+    def build(self):
+        # Encode the whole compiled corpus
+        import WAnet.training
+        curves, geometry, S, N, D, F, G, new_curves, new_geometry = WAnet.training.load_data(packed=True)
+        self.names = numpy.empty(0, dtype=str)
+        self.curves = numpy.empty((0, D * F))
+        self.geometry_latents = numpy.empty((0, self.latent_dim))
+        self.curve_latents = numpy.empty((0, self.latent_dim))
+        self.add(WAnet.training.load_names(), new_geometry, new_curves)
+
+    def add(self, names, geometry, curves):
+        # Geometry and curves use the new_geometry and new_curves layouts from training.load_data, packed or not
+        self._load_encoders()
+        self.names = numpy.concatenate((self.names, names))
+        self.curves = numpy.vstack((self.curves, curves)) if len(self.curves) else numpy.array(curves)
+        for batch in WAnet.voxels.batches(geometry, 1000):
+            self.geometry_latents = numpy.vstack((self.geometry_latents, self.geometry_encoder.predict(batch)))
+        self.curve_latents = numpy.vstack((self.curve_latents, self.curve_encoder.predict(curves)))
+
+        # New cases are searched by brute force until there are enough of them to justify a rebuild
+        if len(self.names) - self.indexed > self.rebuild_fraction * self.indexed:
+            self._rebuild()
+
+    def _query(self, tree, latents, queries, k):
+        distances, indices = tree.query(queries, k=min(k, self.indexed))
+
+        # Merge in anything added since the last rebuild
+        if len(latents) > self.indexed:
+            pending = latents[self.indexed:]
+            extra = numpy.sqrt(numpy.sum(numpy.power(queries[:, None, :] - pending[None, :, :], 2), axis=2))
+            distances = numpy.hstack((distances, extra))
+            indices = numpy.hstack((indices, numpy.tile(numpy.arange(self.indexed, len(latents)), (len(queries), 1))))
+            order = numpy.argsort(distances, axis=1)[:, :k]
+            distances = numpy.take_along_axis(distances, order, axis=1)
+            indices = numpy.take_along_axis(indices, order, axis=1)
+
+        return self.names[indices], distances, self.curves[indices]
+
+    def query_geometry(self, geometry, k=5):
+        self._load_encoders()
+        latents = self.geometry_encoder.predict(numpy.atleast_2d(geometry))
+        return self._query(self.geometry_tree, self.geometry_latents, latents, k)
+
+    def query_curves(self, curves, k=5):
+        self._load_encoders()
+        latents = self.curve_encoder.predict(numpy.atleast_2d(curves))
+        return self._query(self.curve_tree, self.curve_latents, latents, k)
+
+    def save(self):
+        numpy.savez(self._path(), names=self.names, curves=self.curves, geometry_latents=self.geometry_latents,
+                    curve_latents=self.curve_latents)
+
+    def load(self):
+        data = numpy.load(self._path())
+        self.names = data['names']
+        self.curves = data['curves']
+        self.geometry_latents = data['geometry_latents']
+        self.curve_latents = data['curve_latents']
+        self._rebuild()
+
+
+def load_index(latent_dim, directory=None):
+    # Open the saved index for a latent size, building it the first time
+    index = LatentIndex(latent_dim, directory=directory)
+    if os.path.exists(index._path()):
+        index.load()
+    else:
+        index.build()
+        index.save()
+
+    return index
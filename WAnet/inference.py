@@ -0,0 +1,126 @@
+import WAnet.voxels
+import h5py
+import numpy
+import os
+import pkg_resources
+import yaml
+
+
+def _sigmoid(x):
+    # Written to stay finite for large negative inputs
+    return numpy.exp(-numpy.logaddexp(0, -x))
+
+
+def _softmax(x):
+    e = numpy.exp(x - numpy.max(x, axis=-1, keepdims=True))
+    return e / numpy.sum(e, axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {'linear': lambda x: x,
+               'relu': lambda x: numpy.maximum(x, 0),
+               'sigmoid': _sigmoid,
+               'tanh': numpy.tanh,
+               'softmax': _softmax}
+
+
+class _StructureLoader(yaml.SafeLoader):
+    pass
+
+
+# Keras writes python tuples and numpy scalars into the structure files. Shapes come from the weights instead, so
+# the scalars are dropped rather than constructed.
+_StructureLoader.add_constructor('tag:yaml.org,2002:python/tuple', lambda loader, node: loader.construct_sequence(node))
+_StructureLoader.add_multi_constructor('tag:yaml.org,2002:python/object', lambda loader, suffix, node: None)
+
+
+def read_structure(structure):
+    with open(structure, 'r') as file:
+        return yaml.load(file, Loader=_StructureLoader)
+
+
+def read_weights(weights):
+    # Arrays of every layer by name, in the order keras stores them
+    arrays = {}
+    with h5py.File(weights, 'r') as file:
+        for layer in file.attrs['layer_names']:
+            group = file[layer]
+            arrays[layer.decode('utf-8') if isinstance(layer, bytes) else layer] = [
+                group[name][()] for name in group.attrs['weight_names']]
+
+    return arrays
+
+
+class DenseNetwork(object):
+
+    def __init__(self, structure, weights, dtype=numpy.float32):
+        # A saved keras Model made of Dense (and Activation or Dropout) layers, run with NumPy only
+        config = read_structure(structure)
+        if config['class_name'] != 'Model':
+            raise ValueError("Expected a saved keras Model, not "+str(config['class_name']))
+        config = config['config']
+        arrays = read_weights(weights)
+        self.dtype = dtype
+
+        if len(config['input_layers']) != 1 or len(config['output_layers']) != 1:
+            raise ValueError("Only networks with a single input and output are supported")
+        self.input = config['input_layers'][0][0]
+        self.output = config['output_layers'][0][0]
+
+        # Layers are stored in an order where every layer follows its input
+        self.steps = []
+        for layer in config['layers']:
+            name = layer['name']
+            if layer['class_name'] == 'InputLayer':
+                continue
+            if len(layer['inbound_nodes']) != 1 or len(layer['inbound_nodes'][0]) != 1:
+                raise ValueError("Layer "+name+" is shared or has several inputs, which is not supported")
+            source = layer['inbound_nodes'][0][0][0]
+
+            if layer['class_name'] == 'Dense' and arrays[name][0].dtype == numpy.int8:
+                # Written by quantizing.quantize, with the kernel scales after the kernel and bias
+                import WAnet.quantizing
+                kernel = WAnet.quantizing.QuantizedKernel(arrays[name][0], arrays[name][-1].astype(numpy.float32))
+                bias = arrays[name][1].astype(dtype) if layer['config'].get('use_bias', True) else None
+                self.steps.append((name, source, kernel, bias, ACTIVATIONS[layer['config']['activation']]))
+            elif layer['class_name'] == 'Dense':
+                kernel = arrays[name][0].astype(dtype)
+                bias = arrays[name][1].astype(dtype) if layer['config'].get('use_bias', True) else None
+                self.steps.append((name, source, kernel, bias, ACTIVATIONS[layer['config']['activation']]))
+            elif layer['class_name'] == 'Activation':
+                self.steps.append((name, source, None, None, ACTIVATIONS[layer['config']['activation']]))
+            elif layer['class_name'] == 'Dropout':
+                self.steps.append((name, source, None, None, ACTIVATIONS['linear']))
+            else:
+                raise ValueError("Layer "+name+" is a "+layer['class_name']+", only Dense networks are supported")
+
+        kernels = [step[2] for step in self.steps if step[2] is not None]
+        self.input_shape = (None, kernels[0].shape[0])
+        self.output_shape = (None, kernels[-1].shape[1])
+
+    def _forward(self, batch):
+        values = {self.input: batch}
+        for name, source, kernel, bias, activation in self.steps:
+            value = values[source]
+            if kernel is not None:
+                value = numpy.dot(value, kernel) if isinstance(kernel, numpy.ndarray) else kernel.dot(value)
+                if bias is not None:
+                    value += bias
+            values[name] = activation(value)
+
+        return values[self.output]
+
+    def predict(self, x, batch_size=1000):
+        x = numpy.asarray(x, dtype=self.dtype)
+        return numpy.vstack([self._forward(x[i:(i + batch_size)]) for i in range(0, len(x), batch_size)])
+
+
+def load_model(case, quantized=False):
+    # Same naming as application.load_model, e.g. "16geometry_decoder", without importing keras.
+    # quantized loads the int8 weights written by quantizing.quantize instead.
+    weights = "_int8_weights.h5" if quantized else "_weights.h5"
+    network = DenseNetwork(pkg_resources.resource_filename("WAnet", "trained_models/"+case+"_structure.yml"),
+                           pkg_resources.resource_filename("WAnet", "trained_models/"+case+weights))
+    mask = pkg_resources.resource_filename("WAnet", "trained_models/"+case+"_mask.npz")
+    if os.path.exists(mask):
+        return WAnet.voxels.MaskedModel(network, WAnet.voxels.load_mask(mask))
+    return network
@@ -0,0 +1,209 @@
+import WAnet.openwec
+import WAnet.voxels
+import numpy
+
+
+def grid_geometry(G=32):
+    # Lower corner and cell size of the voxel grid of preprocessing.make_grid_axes, in (y, x, z) index order
+    h = 10.0 / G
+    return numpy.array([-5.0, -5.0, -9.5]), h
+
+
+def as_grid(voxels, G=None):
+    # A (G, G, G) boolean grid indexed [y, x, z] from a row in the new_geometry layout or a grid already
+    voxels = numpy.asarray(voxels)
+    if voxels.ndim == 3:
+        return voxels > 0.5
+    voxels = voxels.ravel()
+    if G is None:
+        G = int(round(len(voxels) ** (1.0 / 3)))
+    return voxels.reshape((G, G, G), order='F') > 0.5
+
+
+def coarsen(grid, factor):
+    # Each block of factor^3 cells becomes one cell, filled when at least half of it is
+    if factor == 1:
+        return grid
+    size = -(-numpy.array(grid.shape) // factor) * factor
+    padded = numpy.zeros(size, dtype=float)
+    padded[:grid.shape[0], :grid.shape[1], :grid.shape[2]] = grid
+    blocks = padded.reshape((size[0] // factor, factor, size[1] // factor, factor, size[2] // factor, factor))
+    return blocks.mean(axis=(1, 3, 5)) >= 0.5
+
+
+def _runs(exposed):
+    # Runs of exposed cells along the last axis, as (slice, row, start, stop) index arrays
+    padded = numpy.pad(exposed, ((0, 0), (0, 0), (1, 1)))
+    change = numpy.diff(padded.astype(numpy.int8), axis=2)
+    starts = numpy.argwhere(change == 1)
+    stops = numpy.argwhere(change == -1)
+    return starts[:, 0], starts[:, 1], starts[:, 2], stops[:, 2]
+
+
+def _rectangles(exposed):
+    # Greedy merge of the exposed faces in each slice: runs along the last axis, then identical runs in consecutive
+    # rows, giving (slice, row0, row1, start, stop) half-open rectangles
+    layer, row, start, stop = _runs(exposed)
+    if len(layer) == 0:
+        return numpy.zeros((0, 5), dtype=int)
+    order = numpy.lexsort((row, stop, start, layer))
+    layer, row, start, stop = layer[order], row[order], start[order], stop[order]
+    new = numpy.ones(len(layer), dtype=bool)
+    new[1:] = (numpy.diff(row) != 1) | (numpy.diff(layer) != 0) | (numpy.diff(start) != 0) | (numpy.diff(stop) != 0)
+    group = numpy.cumsum(new) - 1
+    last = numpy.zeros(group[-1] + 1, dtype=int)
+    last[group] = row
+    return numpy.stack((layer[new], row[new], last + 1, start[new], stop[new]), axis=1)
+
+
+def surface_panels(grid):
+    # Quads of the surface of a boolean grid, merged where coplanar, as (n, 4, 3) corners in index units and (n, 3)
+    # outward normals, both in [y, x, z] index order
+    filled = numpy.pad(grid, 1)
+    corners = []
+    normals = []
+    for axis in range(3):
+        others = [a for a in range(3) if a != axis]
+        for side in (-1, 1):
+            exposed = (filled & ~numpy.roll(filled, -side, axis=axis))[1:-1, 1:-1, 1:-1]
+            rectangles = _rectangles(numpy.transpose(exposed, [axis] + others))
+            layer, row0, row1, start, stop = rectangles.T
+
+            quad = numpy.zeros((len(rectangles), 4, 3))
+            quad[:, :, axis] = (layer + (side > 0))[:, None]
+            quad[:, :, others[0]] = numpy.stack((row0, row1, row1, row0), axis=1)
+            quad[:, :, others[1]] = numpy.stack((start, start, stop, stop), axis=1)
+            corners.append(quad)
+
+            normal = numpy.zeros((len(rectangles), 3))
+            normal[:, axis] = side
+            normals.append(normal)
+
+    return numpy.concatenate(corners), numpy.concatenate(normals)
+
+
+def _to_mesh(quads):
+    # openwec.Mesh with four points per panel, as Mesh.combine_meshes builds them
+    msh = WAnet.openwec.Mesh()
+    msh.nf = len(quads)
+    msh.np = 4 * len(quads)
+    points = quads.reshape((-1, 3))
+    msh.X = points[:, 0].copy()
+    msh.Y = points[:, 1].copy()
+    msh.Z = points[:, 2].copy()
+    msh.P = numpy.arange(1, msh.np + 1, dtype=int).reshape((-1, 4))
+    msh.xC = 0.0
+    msh.yC = 0.0
+    msh.zC = 0.0
+    msh.name = 'voxels'
+    return msh
+
+
+def panels(grid, factor=1, waterline=0.0):
+    # World coordinates (x, y, z) of the wetted panels of a grid coarsened by factor, clipped at the waterline,
+    # each ordered like the openwec shapes so that (p1 - p0) x (p3 - p0) points out of the body
+    corner, h = grid_geometry(grid.shape[0])
+    quads, normals = surface_panels(coarsen(grid, factor))
+    quads = corner + quads * h * factor
+    quads = quads[:, :, [1, 0, 2]]
+    normals = normals[:, [1, 0, 2]]
+
+    if waterline is not None:
+        # The voxelizer keeps the cells with centres below the waterline, so a body through the free surface ends at
+        # the cell face nearest it. That face is moved up to the waterline, horizontal panels at or above the free
+        # surface go and the others are cut down to it.
+        level = corner[2] + numpy.round((waterline - corner[2]) / (h * factor)) * h * factor
+        quads[:, :, 2][numpy.abs(quads[:, :, 2] - level) < 1e-9] = waterline
+        keep = numpy.min(quads[:, :, 2], axis=1) < waterline - 1e-9
+        quads = quads[keep]
+        normals = normals[keep]
+        quads[:, :, 2] = numpy.minimum(quads[:, :, 2], waterline)
+
+    # Swapping x and y mirrors the grid, so fix the winding here
+    flip = numpy.sum(numpy.cross(quads[:, 1] - quads[:, 0], quads[:, 3] - quads[:, 0]) * normals, axis=1) < 0
+    quads[flip] = quads[flip][:, ::-1]
+    return quads
+
+
+def voxels_to_mesh(voxels, G=None, target_panels=None, waterline=0.0):
+    # openwec.Mesh of the wetted surface of one geometry, a row of new_geometry or a (G, G, G) grid. With
+    # target_panels the grid is coarsened by powers of two until the merged surface has no more panels than that.
+    grid = as_grid(voxels, G)
+    factor = 1
+    quads = panels(grid, factor, waterline)
+    while target_panels is not None and len(quads) > target_panels and factor < grid.shape[0]:
+        # Small bodies can vanish on coarse grids, the last grid that kept them is used then
+        coarser = panels(grid, 2 * factor, waterline)
+        if len(coarser) == 0:
+            break
+        factor *= 2
+        quads = coarser
+
+    return _to_mesh(quads)
+
+
+def meshes(geometry, target_panels=None, waterline=0.0, batch_size=1000):
+    # Meshes of every row of geometry, dense or PackedVoxels, one at a time
+    for batch in WAnet.voxels.batches(geometry, batch_size, numpy.uint8):
+        for voxels in batch:
+            yield voxels_to_mesh(voxels, None, target_panels, waterline)
+
+
+def solve_geometry(geometry, target_panels=200, waterline=0.0):
+    # Solves every geometry with NEMOH as a new case, e.g. to check the designs of the inverse network
+    import WAnet.preprocessing
+    case_dirs = []
+    for msh in meshes(geometry, target_panels, waterline):
+        case_dirs.append(WAnet.preprocessing.new_case_dir('mesh'))
+        WAnet.preprocessing.solve_mesh(msh, case_dirs[-1])
+
+    return case_dirs
+
+
+def symmetries(msh, tolerance=1e-6):
+    # Planes the points of a mesh are mirror symmetric about, 'xz' (y -> -y) and 'yz' (x -> -x)
+    points = numpy.vstack((msh.X, msh.Y, msh.Z)).T
+    keys = set(map(tuple, numpy.round(points / tolerance).astype(numpy.int64)))
+    planes = []
+    for plane, mirror in (('xz', [1, -1, 1]), ('yz', [-1, 1, 1])):
+        mirrored = numpy.round(points * mirror / tolerance).astype(numpy.int64)
+        if all(tuple(key) in keys for key in mirrored):
+            planes.append(plane)
+
+    return planes
+
+
+def _clip(polygon, tolerance):
+    # Part of a polygon on the y >= 0 side, by Sutherland-Hodgman against the xz-plane
+    output = []
+    for current, following in zip(polygon, numpy.roll(polygon, -1, axis=0)):
+        inside = current[1] >= -tolerance
+        if inside:
+            output.append(current)
+        if inside != (following[1] >= -tolerance):
+            output.append(current + current[1] / (current[1] - following[1]) * (following - current))
+
+    # Drop repeated corners, which the openwec shapes use for triangles
+    output = [point for i, point in enumerate(output) if numpy.linalg.norm(point - output[i - 1]) > tolerance]
+    return numpy.array(output)
+
+
+def half_mesh(msh, tolerance=1e-9):
+    # Panels of an xz-symmetric mesh on the y >= 0 side, cut where they cross y = 0, as NEMOH takes them with nsym = 1
+    points = numpy.vstack((msh.X, msh.Y, msh.Z)).T
+    quads = []
+    for panel in numpy.asarray(msh.P, dtype=int):
+        polygon = _clip(points[panel - 1], tolerance)
+        if len(polygon) < 3 or numpy.all(numpy.abs(polygon[:, 1]) <= tolerance):
+            continue
+
+        # Triangles repeat their last corner, larger polygons are fanned into quads
+        for start in range(1, len(polygon) - 1, 2):
+            corners = polygon[[0, start, start + 1, min(start + 2, len(polygon) - 1)]]
+            if numpy.linalg.norm(numpy.cross(corners[1] - corners[0], corners[2] - corners[0])) > tolerance:
+                quads.append(corners)
+
+    half = _to_mesh(numpy.array(quads).reshape((-1, 4, 3)))
+    half.xC, half.yC, half.zC = msh.xC, msh.yC, getattr(msh, 'zC', 0.0)
+    half.name = getattr(msh, 'name', 'mesh')
+    return half
@@ -0,0 +1,91 @@
+import WAnet.voxels
+import numpy
+
+# Same clipping as the keras backend
+EPSILON = 1e-7
+
+
+def binary_crossentropy(target, output):
+    # Element-wise, with keras.backend argument order, so output is the clipped one
+    output = numpy.clip(output, EPSILON, 1 - EPSILON)
+    return -(target * numpy.log(output) + (1 - target) * numpy.log(1 - output))
+
+
+class StreamingMetrics(object):
+
+    def __init__(self, loss='mse', D=None, F=None):
+        # D and F give the per-DoF and per-frequency breakdowns of outputs laid out like new_curves
+        self.loss = loss
+        self.D = D
+        self.F = F
+        self.count = 0
+        self.elements = 0
+        self.error = 0.0
+        self.total = 0.0
+        self.squares = 0.0
+        self.log_true = 0.0
+        self.log_false = 0.0
+        self.breakdown = D is not None and F is not None
+        if self.breakdown:
+            self.error_grid = numpy.zeros((D, F))
+            self.total_grid = numpy.zeros((D, F))
+            self.squares_grid = numpy.zeros((D, F))
+
+    def update(self, y_pred, y_true):
+        y_pred = numpy.asarray(y_pred, dtype=numpy.float64)
+        y_true = numpy.asarray(y_true, dtype=numpy.float64)
+
+        # The trainers have always passed the prediction as the bce target, keep it that way so numbers compare
+        if self.loss == 'bce':
+            errors = binary_crossentropy(y_pred, y_true)
+            clipped = numpy.clip(y_true, EPSILON, 1 - EPSILON)
+            self.log_true += numpy.sum(numpy.log(clipped))
+            self.log_false += numpy.sum(numpy.log(1 - clipped))
+        else:
+            errors = numpy.power(y_pred - y_true, 2)
+
+        self.count += len(y_true)
+        self.elements += y_true.size
+        self.error += numpy.sum(errors)
+        self.total += numpy.sum(y_true)
+        self.squares += numpy.sum(numpy.power(y_true, 2))
+        if self.breakdown:
+            self.error_grid += numpy.sum(errors.reshape((-1, self.D, self.F)), axis=0)
+            self.total_grid += numpy.sum(y_true.reshape((-1, self.D, self.F)), axis=0)
+            self.squares_grid += numpy.sum(numpy.power(y_true, 2).reshape((-1, self.D, self.F)), axis=0)
+
+    def result(self):
+        elements = float(self.elements)
+        error = self.error / elements
+        mean = self.total / elements
+        if self.loss == 'bce':
+            # Every prediction replaced by the mean of the truth, as the trainers' baseline
+            s2 = -(mean * self.log_true + (1 - mean) * self.log_false) / elements
+        else:
+            s2 = self.squares / elements - mean ** 2
+
+        results = {'error': error, 's2': s2, 'r2': 1 - error / s2, 'count': self.count}
+        if self.breakdown:
+            dof_error = numpy.sum(self.error_grid, axis=1) / (self.count * self.F)
+            dof_mean = numpy.sum(self.total_grid, axis=1) / (self.count * self.F)
+            dof_s2 = numpy.sum(self.squares_grid, axis=1) / (self.count * self.F) - dof_mean ** 2
+            results['error_per_dof'] = dof_error
+            results['r2_per_dof'] = 1 - dof_error / dof_s2
+            results['error_per_frequency'] = numpy.sum(self.error_grid, axis=0) / (self.count * self.D)
+
+        return results
+
+
+def evaluate(model, x, y=None, loss='mse', D=None, F=None, batch_size=500, dtype=numpy.float32):
+    # Scores model on x against y, or against x for autoencoders, without holding more than a batch in memory
+    metrics = StreamingMetrics(loss, D, F)
+    for i, batch in enumerate(WAnet.voxels.batches(x, batch_size, dtype)):
+        batch = numpy.asarray(batch, dtype=dtype)
+        if y is None:
+            truth = batch
+        else:
+            truth = y[(i * batch_size):((i + 1) * batch_size)]
+            truth = truth.unpack(dtype) if isinstance(truth, WAnet.voxels.PackedVoxels) else numpy.asarray(truth)
+        metrics.update(model.predict(batch), truth)
+
+    return metrics.result()
@@ -0,0 +1,86 @@
+import numpy
+
+
+def evaluate_latents(latents, target, decoder, forward, threshold=0.51, batch_size=1000):
+    # Decode to voxels, threshold like plot_voxels, and score the forward prediction against the target
+    geometry = decoder.predict(latents, batch_size=batch_size)
+    geometry = (geometry > threshold).astype(geometry.dtype)
+    curves = forward.predict(geometry, batch_size=batch_size)
+    loss = numpy.mean(numpy.power(curves - target, 2), axis=1)
+
+    return loss, geometry, curves
+
+
+def optimize_design(target, latent_dim, population=None, generations=100, sigma=1.0, number_of_candidates=10,
+                    threshold=0.51, x0=None, seed=None, batch_size=1000, decoder=None, forward=None):
+    # Target curves use the new_curves layout from training.load_data, i.e. (D, F) or flattened and scaled by 1e-6.
+    # The trained decoder and forward network of latent_dim are loaded unless given.
+    target = numpy.asarray(target).flatten()
+    if decoder is None or forward is None:
+        import WAnet.application
+    if decoder is None:
+        decoder = WAnet.application.load_model(str(latent_dim)+'geometry_decoder')
+    if forward is None:
+        forward = WAnet.application.load_model(str(latent_dim)+'forward')
+    random = numpy.random.RandomState(seed)
+
+    # CMA-ES strategy parameters (Hansen, The CMA Evolution Strategy: A Tutorial)
+    n = latent_dim
+    lam = population if population is not None else 4 + int(3 * numpy.log(n))
+    mu = lam // 2
+    weights = numpy.log(mu + 0.5) - numpy.log(numpy.arange(1, mu + 1))
+    weights = weights / numpy.sum(weights)
+    mueff = 1 / numpy.sum(numpy.power(weights, 2))
+    cc = (4 + mueff / n) / (n + 4 + 2 * mueff / n)
+    cs = (mueff + 2) / (n + mueff + 5)
+    c1 = 2 / ((n + 1.3) ** 2 + mueff)
+    cmu = min(1 - c1, 2 * (mueff - 2 + 1 / mueff) / ((n + 2) ** 2 + mueff))
+    damps = 1 + 2 * max(0, numpy.sqrt((mueff - 1) / (n + 1)) - 1) + cs
+    chiN = numpy.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n * n))
+
+    # Start from the prior of the variational autoencoder unless told otherwise
+    mean = numpy.zeros(n) if x0 is None else numpy.asarray(x0, dtype=float)
+    pc = numpy.zeros(n)
+    ps = numpy.zeros(n)
+    C = numpy.eye(n)
+
+    best_latents = numpy.empty((0, n))
+    best_losses = numpy.empty(0)
+    for generation in range(generations):
+        # Sample and evaluate a whole population in one batch
+        eigenvalues, B = numpy.linalg.eigh(C)
+        D = numpy.sqrt(numpy.maximum(eigenvalues, 1e-20))
+        z = random.standard_normal((lam, n))
+        y = numpy.dot(z * D, B.T)
+        latents = mean + sigma * y
+        loss, _, _ = evaluate_latents(latents, target, decoder, forward, threshold, batch_size)
+
+        # Keep the best candidates seen so far
+        best_latents = numpy.vstack((best_latents, latents))
+        best_losses = numpy.concatenate((best_losses, loss))
+        order = numpy.argsort(best_losses)[:number_of_candidates]
+        best_latents = best_latents[order]
+        best_losses = best_losses[order]
+
+        # Recombination
+        order = numpy.argsort(loss)[:mu]
+        y_w = numpy.dot(weights, y[order])
+        mean = mean + sigma * y_w
+
+        # Step-size control
+        C_invsqrt = numpy.dot(B / D, B.T)
+        ps = (1 - cs) * ps + numpy.sqrt(cs * (2 - cs) * mueff) * numpy.dot(C_invsqrt, y_w)
+        hsig = numpy.linalg.norm(ps) / numpy.sqrt(1 - (1 - cs) ** (2 * (generation + 1))) / chiN < 1.4 + 2 / (n + 1)
+
+        # Covariance matrix adaptation
+        pc = (1 - cc) * pc + hsig * numpy.sqrt(cc * (2 - cc) * mueff) * y_w
+        rank_mu = numpy.dot((weights * y[order].T), y[order])
+        C = (1 - c1 - cmu) * C + c1 * (numpy.outer(pc, pc) + (1 - hsig) * cc * (2 - cc) * C) + cmu * rank_mu
+        C = (C + C.T) / 2
+        sigma = sigma * numpy.exp((cs / damps) * (numpy.linalg.norm(ps) / chiN - 1))
+
+    # Return the ranked candidates with their geometry and predicted curves
+    loss, geometry, curves = evaluate_latents(best_latents, target, decoder, forward, threshold, batch_size)
+    order = numpy.argsort(loss)
+
+    return best_latents[order], geometry[order], curves[order], loss[order]
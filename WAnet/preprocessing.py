@@ -1,140 +1,196 @@
 import shutil
+import WAnet.meshing
 import WAnet.openwec
+import WAnet.voxels
 import numpy
-import scipy.spatial
-import sklearn.utils
 import pkg_resources
 import os
+import re
 
 
-def generate_data():
-    data_dir = pkg_resources.resource_filename('WAnet', 'data')
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
+GEOMETRIES = {
+    "box": {
+        "vars": {
+            "length": [3, 10],
+            "width":  [3, 10],
+            "height": [3, 10]
+        }
+    },
+    "cone": {
+        "vars": {
+            "diameter": [3, 10],
+            "height":   [3, 10]
+        }
+    },
+    "cylinder": {
+        "vars": {
+            "diameter": [3, 10],
+            "height":   [3, 10]
+        }
+    },
+    "sphere": {
+        "vars": {
+            "diameter": [3, 10]
+        }
+    },
+    "wedge": {
+        "vars": {
+            "length": [3, 10],
+            "width":  [3, 10],
+            "height": [3, 7.5]
+        }
+    },
+}
 
-    # Save the current directory for later use
-    save_dir = os.path.join(os.getcwd(), data_dir)
 
+def solve_mesh(msh, case_dir, symmetry=True):
     # Define info for running the simulations
     minimum_frequency = 0.05
     maximum_frequency = 2.0
     frequency_steps = 64
     waterDepth = 100
     nPanels = 200
-    number_of_random_draws = 1000
     rhoW = 1000.0
     zG = 0
-    geometries = {
-        "box": {
-            "vars": {
-                "length": [3, 10],
-                "width":  [3, 10],
-                "height": [3, 10]
-            }
-        },
-        "cone": {
-            "vars": {
-                "diameter": [3, 10],
-                "height":   [3, 10]
-            }
-        },
-        "cylinder": {
-            "vars": {
-                "diameter": [3, 10],
-                "height":   [3, 10]
-            }
-        },
-        "sphere": {
-            "vars": {
-                "diameter": [3, 10]
-            }
-        },
-        "wedge": {
-            "vars": {
-                "length": [3, 10],
-                "width":  [3, 10],
-                "height": [3, 7.5]
-            }
-        },
+
+    # Make the project directory and a directory to save things in
+    if not os.path.exists(case_dir):
+        os.makedirs(case_dir)
+    WAnet.openwec.make_project_directory()
+
+    # Bodies symmetric about the xz-plane are meshed by halves, which NEMOH mirrors back. Half the panels keep the
+    # resolution of the whole body.
+    nsym = 0
+    if symmetry and 'xz' in WAnet.meshing.symmetries(msh):
+        msh = WAnet.meshing.half_mesh(msh)
+        nsym = 1
+        nPanels = nPanels // 2
+
+    # Make the mesh
+    WAnet.openwec.writeMesh(msh, os.path.join(os.path.join(os.path.expanduser('~'), 'openWEC'),
+                                              'Calculation', 'mesh', 'axisym'))
+    WAnet.openwec.createMeshOpt([msh.xC, msh.yC, zG], nPanels, nsym, rhoW)
+
+    # Run Nemoh on the mesh
+    advOps = {
+        'dirCheck': False,
+        'irfCheck': False,
+        'kochCheck': False,
+        'fsCheck': False,
+        'parkCheck': False
     }
+    nbody = WAnet.openwec.writeCalFile(rhoW, waterDepth, [frequency_steps, minimum_frequency, maximum_frequency],
+                                       zG, [1, 0, 1, 0, 1, 0], aO=advOps)
+    WAnet.openwec.runNemoh(nbody)
+
+    # Copy out what is needed
+    shutil.copy(os.path.join(os.path.expanduser("~"), 'openWEC/Calculation/axisym.dat'), case_dir)
+    shutil.copy(os.path.join(os.path.expanduser("~"), 'openWEC/Calculation/Nemoh.cal'), case_dir)
+    shutil.copy(os.path.join(os.path.expanduser("~"), 'openWEC/Calculation/results/RadiationCoefficients.tec'), case_dir)
+    shutil.copy(os.path.join(os.path.expanduser("~"), 'openWEC/Calculation/results/DiffractionForce.tec'), case_dir)
+    shutil.copy(os.path.join(os.path.expanduser("~"), 'openWEC/Calculation/results/ExcitationForce.tec'), case_dir)
+
+    # Cleanup the project directory
+    WAnet.openwec.clean_directory()
+
+    return True
+
+
+def solve_shape(shape, dimensions, case_dir):
+    # Save the shape index and dimensions next to the results
+    if not os.path.exists(case_dir):
+        os.makedirs(case_dir)
+    shape_index = list(GEOMETRIES).index(shape)
+    numpy.savetxt(case_dir + '/geometry.txt', numpy.array([shape_index] + list(dimensions)))
+
+    msh = getattr(WAnet.openwec, shape)(*dimensions, [0, 0, 0])
+    msh.panelize()
+
+    return solve_mesh(msh, case_dir)
 
-    for shape in geometries:
+
+def new_case_dir(shape):
+    # Next unused case directory for a shape in the NEMOH corpus
+    nemoh_dir = pkg_resources.resource_filename('WAnet', 'data/NEMOH_data/')
+    i = 0
+    while os.path.exists(os.path.join(nemoh_dir, shape + str(i).zfill(3))):
+        i += 1
+
+    return os.path.join(nemoh_dir, shape + str(i).zfill(3))
+
+
+def case_names(shapes=None):
+    # Case directories of the primitive shapes in the NEMOH corpus, leaving out meshes such as meshing.solve_geometry
+    # and evaluating.HybridEvaluator write next to them
+    nemoh_dir = pkg_resources.resource_filename('WAnet', 'data/NEMOH_data/')
+    pattern = re.compile('^(' + '|'.join(GEOMETRIES if shapes is None else shapes) + r')\d{3,}$')
+    return sorted(name for name in os.listdir(nemoh_dir)
+                  if pattern.match(name) and os.path.isdir(os.path.join(nemoh_dir, name)))
+
+
+def generate_data():
+    data_dir = pkg_resources.resource_filename('WAnet', 'data')
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+
+    # Save the current directory for later use
+    save_dir = os.path.join(os.getcwd(), data_dir)
+
+    number_of_random_draws = 1000
+
+    for shape in GEOMETRIES:
         print(shape)
 
     # Run the simulations
-    for shape_index, shape in enumerate(geometries):
+    for shape in GEOMETRIES:
         for i in range(number_of_random_draws):
-            # Make the project directory and a directory to save things in
-            temp_dir = os.path.join(save_dir, shape + str(i).zfill(3))
-            if not os.path.exists(temp_dir):
-                os.mkdir(temp_dir)
-            WAnet.openwec.helpers.make_project_directory()
-
-            # Dynamically define some variables, and save to file
-            for var, limits in geometries[shape]["vars"].items():
-                print(var + " = " + str(numpy.random.uniform(limits[0], limits[1])))
-                exec(var + " = " + str(numpy.random.uniform(limits[0], limits[1])))
-            numpy.savetxt(temp_dir + '/geometry.txt',
-                          numpy.array(eval("[" + str(shape_index) + "," +
-                                           ", ".join(geometries[shape]["vars"].keys()) + "]")))
-
-            # Make the mesh
-            print("meshTypes."+shape+"("+", ".join(geometries[shape]["vars"].keys())+", [0, 0, 0])")
-            msh = eval("WAnet.openwec.meshTypes."+shape+"("+", ".join(geometries[shape]["vars"].keys())+", [0, 0, 0])")
-            msh.panelize()
-            WAnet.openwec.meshTypes.writeMesh(msh,
-                                             os.path.join(os.path.join(os.path.expanduser('~'), 'openWEC'),
-                                                          'Calculation', 'mesh', 'axisym'))
-            WAnet.openwec.nemoh.createMeshOpt([msh.xC, msh.yC, zG], nPanels, int(0), rhoW)
-
-            # Run Nemoh on the mesh
-            advOps = {
-                'dirCheck': False,
-                'irfCheck': False,
-                'kochCheck': False,
-                'fsCheck': False,
-                'parkCheck': False
-            }
-            nbody = WAnet.openwec.nemoh.writeCalFile(rhoW, waterDepth,
-                                                    [frequency_steps, minimum_frequency, maximum_frequency],
-                                                    zG, [1, 0, 1, 0, 1, 0], aO=advOps)
-            WAnet.openwec.nemoh.runNemoh(nbody)
-
-            # Copy out what is needed
-            shutil.copy(os.path.join(os.path.expanduser("~"), 'openWEC/Calculation/axisym.dat'), temp_dir)
-            shutil.copy(os.path.join(os.path.expanduser("~"), 'openWEC/Calculation/Nemoh.cal'), temp_dir)
-            shutil.copy(os.path.join(os.path.expanduser("~"), 'openWEC/Calculation/results/RadiationCoefficients.tec'), temp_dir)
-            shutil.copy(os.path.join(os.path.expanduser("~"), 'openWEC/Calculation/results/DiffractionForce.tec'), temp_dir)
-            shutil.copy(os.path.join(os.path.expanduser("~"), 'openWEC/Calculation/results/ExcitationForce.tec'), temp_dir)
-
-            # Cleanup the project directory
-            WAnet.openwec.helpers.clean_directory()
+            # Draw the dimensions of the shape
+            dimensions = []
+            for var, limits in GEOMETRIES[shape]["vars"].items():
+                dimensions.append(numpy.random.uniform(limits[0], limits[1]))
+                print(var + " = " + str(dimensions[-1]))
+
+            solve_shape(shape, dimensions, os.path.join(save_dir, shape + str(i).zfill(3)))
 
     return True
 
 
-def extract_data(N=1000):
+def read_excitation_force(dir_path):
+    # Amplitudes of the surge, heave and pitch excitation force at each frequency
+    curve = []
+    with open(dir_path + '/ExcitationForce.tec') as fid:
+        for line in fid:
+            if line.find('"') == -1:
+                str_list = line.split(' ')
+                str_list = filter(None, str_list)
+                new_array = numpy.array([float(elem) for elem in str_list])
+                curve.append([new_array[1], new_array[3], new_array[5]])
+
+    return numpy.array(curve)
+
+
+def extract_data(N=1000, G=32, octree=True, cases=None):
     # Define constants
     S = 5
     D = 3
     F = 64
-    G = 32
+
+    # Given case names are compiled all of them, S * N is only ever read as the number of cases
+    if cases is not None:
+        S, N = 1, len(cases)
 
     # Initialize some huge vectors
     curves = numpy.empty([S * N, F, 3])
-    geometry = numpy.zeros([S * N, G, G, G, 1])
+    geometry = numpy.zeros([S * N, (G * G * G + 7) // 8], dtype=numpy.uint8)
 
     # Set up test points
-    ex = 5 - 5 / G
-    x, y, z = numpy.meshgrid(numpy.linspace(-ex, ex, G),
-                             numpy.linspace(-ex, ex, G),
-                             numpy.linspace(-(9.5 - 5 / G), 0.5 - 5 / G, G))
-    test_points = numpy.vstack((x.ravel(), y.ravel(), z.ravel())).T
+    test_points = None if octree else make_test_points(G)
 
     # Step through data
     current = 0
     nemoh_dir = pkg_resources.resource_filename('WAnet', 'data/NEMOH_data/')
-    data = sklearn.utils.shuffle(os.listdir(pkg_resources.resource_filename('WAnet', 'data/NEMOH_data/')))
+    import sklearn.utils
+    data = sklearn.utils.shuffle(os.listdir(nemoh_dir) if cases is None else list(cases))
     for i in range(S * N):
         dd = data[i]
         print(dd)
@@ -142,58 +198,164 @@ def extract_data(N=1000):
         if os.path.isdir(dir_path):
 
             # Read in the hydrodynamic coefficients
-            with open(dir_path + '/ExcitationForce.tec') as fid:
-                current_f = 0
-                for line in fid:
-                    if line.find('"') is -1:
-                        str_list = line.split(' ')
-                        str_list = filter(None, str_list)
-                        new_array = numpy.array([float(elem) for elem in str_list])
-                        # curves[i, current_f, :] = new_array[1:]
-                        curves[i, current_f, 0] = new_array[1]
-                        curves[i, current_f, 1] = new_array[3]
-                        curves[i, current_f, 2] = new_array[5]
-                        current_f += 1
-
-            # Read in existing vertices
-            vertices = numpy.empty([0, 3])
-            with open(dir_path + '/axisym.dat') as fid:
-                for line in fid:
-                    vert = numpy.array([float(elem) for elem in filter(None, line.split(' '))])
-                    if sum(vert) == 0:
-                        break
-                    if len(vert) == 4:
-                        vertices = numpy.vstack([vertices, vert[1:4]])
-
-            # Jiggle to avoid memory issues with Delaunay below.
-            vertices += 0.001 * numpy.random.random(vertices.shape)
+            curves[i, :, :] = read_excitation_force(dir_path)
 
             # Check points in hull of vertices
-            hull = scipy.spatial.Delaunay(vertices)
-            within = hull.find_simplex(test_points) >= 0
+            vertices = read_vertices(dir_path)
+            if octree:
+                within = voxelize_vertices(vertices, G)
+            else:
+                within = _points_in_hull(vertices, test_points).reshape((G, G, G)).flatten(order='F')
 
             # Stop if resolution is too low
             if sum(within) == 0:
                 print("Bad!")
                 break
 
-            # maxer = np.max(vertices, axis=0)
-            # miner = np.min(vertices, axis=0)
-            # if maxer[2] > 0.25:
-            #     print(dd, maxer[2])
-            # if miner[2] < -5.25:
-            #     print(dd, miner[2])
-
-            # Reshape and save
-            geometry[i, :, :, :, 0] = within.reshape((G, G, G))
+            # Save one bit per voxel
+            geometry[i, :] = WAnet.voxels.pack(within)[0]
 
     # Check that compiled_data exists
     sd = pkg_resources.resource_filename('WAnet', 'data/compiled_data')
     if not os.path.exists(sd):
         os.makedirs(sd)
 
-    numpy.savez(pkg_resources.resource_filename('WAnet', 'data/compiled_data/data_geometry.npz'), geometry=geometry)
-    numpy.savez(pkg_resources.resource_filename('WAnet', 'data/compiled_data/data_curves.npz'), curves=curves)
+    WAnet.voxels.PackedVoxels(geometry, G).save(pkg_resources.resource_filename('WAnet', 'data/compiled_data/data_geometry.npz'))
+    numpy.savez(pkg_resources.resource_filename('WAnet', 'data/compiled_data/data_curves.npz'), curves=curves,
+                names=numpy.array(data[:S * N]))
     numpy.savez(pkg_resources.resource_filename('WAnet', 'data/compiled_data/constants.npz'), S=S, N=N, D=D, F=F, G=G)
 
+    # Voxels that are empty or full in every case, which the networks can leave out
+    mask = WAnet.voxels.VoxelMask.from_data(WAnet.voxels.PackedVoxels(geometry, G), G)
+    mask.save(pkg_resources.resource_filename('WAnet', 'data/compiled_data/voxel_mask.npz'))
+    print("Active voxels: "+str(mask.size)+" of "+str(mask.count))
+
     return True
+
+
+def read_vertices(dir_path):
+    # Vertices of the panel mesh written by the NEMOH mesher
+    vertices = []
+    with open(dir_path + '/axisym.dat') as fid:
+        symmetric = int(fid.readline().split()[1]) == 1
+        for line in fid:
+            vert = [float(elem) for elem in filter(None, line.split(' '))]
+            if sum(vert) == 0:
+                break
+            if len(vert) == 4:
+                vertices.append(vert[1:4])
+
+    # Meshes solved with a symmetry about the xz-plane only hold the y >= 0 half
+    vertices = numpy.array(vertices)
+    if symmetric:
+        vertices = numpy.vstack((vertices, vertices * [1, -1, 1]))
+
+    return vertices
+
+
+def make_grid_axes(G=32):
+    # Coordinates of the voxel centres along x, y and z
+    ex = 5 - 5 / G
+    return (numpy.linspace(-ex, ex, G),
+            numpy.linspace(-ex, ex, G),
+            numpy.linspace(-(9.5 - 5 / G), 0.5 - 5 / G, G))
+
+
+def make_test_points(G=32):
+    # Centres of the voxel grid used by extract_data and every network
+    x, y, z = numpy.meshgrid(*make_grid_axes(G))
+    return numpy.vstack((x.ravel(), y.ravel(), z.ravel())).T
+
+
+def _hull_equations(vertices):
+    # Facets of the convex hull, clipped at the waterline since only the submerged part is meshed by NEMOH
+    import scipy.spatial
+    equations = scipy.spatial.ConvexHull(vertices).equations
+    return numpy.vstack((equations, [0, 0, 1, 0]))
+
+
+def _points_in_hull(vertices, test_points):
+    equations = _hull_equations(vertices)
+    return numpy.all(numpy.dot(test_points, equations[:, :3].T) + equations[:, 3] <= 1e-9, axis=1)
+
+
+def _octree_in_hull(equations, axes, leaf_size=4):
+    # Grid points come in the (y, x, z) order of numpy.meshgrid, as in make_test_points
+    x, y, z = axes
+    within = numpy.zeros((len(y), len(x), len(z)), dtype=bool)
+
+    # Blocks are half-open index ranges [y0, y1, x0, x1, z0, z1]
+    blocks = numpy.array([[0, len(y), 0, len(x), 0, len(z)]])
+    while len(blocks):
+        # Signed distance of the eight corner points of each block to every facet
+        corner_index = numpy.array([[a, b, c] for a in (0, 1) for b in (2, 3) for c in (4, 5)])
+        corners = blocks[:, corner_index] - numpy.array([0, 0, 0, 1, 1, 1])[corner_index % 2 * 3]
+        points = numpy.stack((x[corners[:, :, 1]], y[corners[:, :, 0]], z[corners[:, :, 2]]), axis=2)
+        distance = numpy.dot(points, equations[:, :3].T) + equations[:, 3]
+
+        # A convex body holds a block whose corners it holds, and misses a block entirely behind one facet
+        full = numpy.all(distance <= 1e-9, axis=(1, 2))
+        empty = numpy.any(numpy.all(distance > 1e-9, axis=1), axis=1)
+        for y0, y1, x0, x1, z0, z1 in blocks[full]:
+            within[y0:y1, x0:x1, z0:z1] = True
+
+        # Check small boundary blocks point by point and split the rest in eight
+        blocks = blocks[~full & ~empty]
+        small = numpy.all(blocks[:, 1::2] - blocks[:, 0::2] <= leaf_size, axis=1)
+        for y0, y1, x0, x1, z0, z1 in blocks[small]:
+            yy, xx, zz = numpy.meshgrid(y[y0:y1], x[x0:x1], z[z0:z1], indexing='ij')
+            points = numpy.stack((xx, yy, zz), axis=3)
+            within[y0:y1, x0:x1, z0:z1] = numpy.all(numpy.dot(points, equations[:, :3].T) + equations[:, 3] <= 1e-9,
+                                                    axis=3)
+
+        blocks = blocks[~small]
+        middle = (blocks[:, 0::2] + blocks[:, 1::2]) // 2
+        children = []
+        for a in ((0, 0), (0, 1)):
+            for b in ((1, 0), (1, 1)):
+                for c in ((2, 0), (2, 1)):
+                    child = blocks.copy()
+                    for axis, upper in (a, b, c):
+                        if upper:
+                            child[:, 2 * axis] = middle[:, axis]
+                        else:
+                            child[:, 2 * axis + 1] = middle[:, axis]
+                    children.append(child)
+        blocks = numpy.vstack(children) if children else blocks
+        blocks = blocks[numpy.all(blocks[:, 1::2] > blocks[:, 0::2], axis=1)]
+
+    return within
+
+
+def voxelize_vertices(vertices, G=32):
+    within = _octree_in_hull(_hull_equations(vertices), make_grid_axes(G))
+
+    # Same Fortran-ordered flattening as new_geometry in training.load_data
+    return within.flatten(order='F')
+
+
+def voxelize_mesh(msh, G=32):
+    return voxelize_vertices(numpy.vstack((msh.X, msh.Y, msh.Z)).T, G)
+
+
+def voxelize_shape(shape, dimensions, G=32):
+    msh = getattr(WAnet.openwec, shape)(*dimensions, [0, 0, 0])
+    return voxelize_mesh(msh, G)
+
+
+def voxelize_batch(candidates, G=32, packed=False):
+    # Candidates are (shape, dimensions) pairs or mesh objects with X, Y and Z
+    if packed:
+        voxels = numpy.zeros((len(candidates), (G * G * G + 7) // 8), dtype=numpy.uint8)
+    else:
+        voxels = numpy.zeros((len(candidates), G * G * G))
+    for i, candidate in enumerate(candidates):
+        if isinstance(candidate, (tuple, list)):
+            within = voxelize_shape(candidate[0], candidate[1], G)
+        else:
+            within = voxelize_mesh(candidate, G)
+        voxels[i, :] = WAnet.voxels.pack(within)[0] if packed else within
+
+    if packed:
+        return WAnet.voxels.PackedVoxels(voxels, G)
+    return voxels
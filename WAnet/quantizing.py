@@ -0,0 +1,186 @@
+import WAnet.inference
+import WAnet.metrics
+import WAnet.voxels
+import argparse
+import h5py
+import numpy
+import pkg_resources
+import sys
+import time
+
+
+class QuantizedKernel(object):
+
+    def __init__(self, values, scale):
+        # int8 values with one float32 scale per output channel, kernel ~= values * scale
+        self.values = values
+        self.scale = scale
+        self.shape = values.shape
+
+    @classmethod
+    def from_float(cls, kernel):
+        scale = numpy.max(numpy.abs(kernel), axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        values = numpy.clip(numpy.round(kernel / scale), -127, 127).astype(numpy.int8)
+        return cls(values, scale.astype(numpy.float32))
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.scale.nbytes
+
+    def dequantize(self):
+        return self.values * self.scale
+
+    def dot(self, x, block=4096):
+        # x times the kernel, widening a block of rows at a time so that the float32 copy never exceeds block rows.
+        # The scale is per output channel, so it comes out of the sum and is applied once at the end.
+        output = numpy.zeros((len(x), self.shape[1]), dtype=numpy.float32)
+        for i in range(0, self.shape[0], block):
+            output += numpy.dot(x[:, i:(i + block)], self.values[i:(i + block)].astype(numpy.float32))
+        return output * self.scale
+
+
+def quantize_weights(weights, quantized):
+    # Copy of a keras weights file with every Dense kernel stored as int8 and a kernel_scale next to it
+    with h5py.File(weights, 'r') as source, h5py.File(quantized, 'w') as target:
+        target.attrs['layer_names'] = source.attrs['layer_names']
+        for layer in source.attrs['layer_names']:
+            group = target.create_group(layer)
+            names = list(source[layer].attrs['weight_names'])
+            for name in list(names):
+                array = source[layer][name][()]
+                if name.endswith(b'/kernel') and array.ndim == 2:
+                    kernel = QuantizedKernel.from_float(array)
+                    group.create_dataset(name, data=kernel.values)
+                    group.create_dataset(name+b'_scale', data=kernel.scale)
+                    names.append(name+b'_scale')
+                else:
+                    group.create_dataset(name, data=array)
+            group.attrs['weight_names'] = names
+
+
+def quantize(case):
+    # Writes trained_models/{case}_int8_weights.h5, for inference.load_model(case, quantized=True)
+    weights = pkg_resources.resource_filename('WAnet', 'trained_models/'+case+'_weights.h5')
+    quantized = pkg_resources.resource_filename('WAnet', 'trained_models/'+case+'_int8_weights.h5')
+    quantize_weights(weights, quantized)
+    return quantized
+
+
+def _model_bytes(model):
+    network = getattr(model, 'model', model)
+    return int(sum(step[2].nbytes + (0 if step[3] is None else step[3].nbytes)
+                   for step in network.steps if step[2] is not None))
+
+
+def _latency(model, x, rounds=5):
+    times = []
+    for i in range(rounds):
+        started = time.perf_counter()
+        model.predict(x)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+class Chain(object):
+
+    def __init__(self, *models):
+        # Models run one after the other, such as an encoder and the decoder it was trained with
+        self.models = models
+
+    @property
+    def input_shape(self):
+        return self.models[0].input_shape
+
+    @property
+    def output_shape(self):
+        return self.models[-1].output_shape
+
+    def predict(self, x, batch_size=1000):
+        for model in self.models:
+            x = model.predict(x, batch_size=batch_size)
+        return x
+
+
+def _scored(case, original, quantized):
+    # Encoders and decoders are scored on reconstructions through their autoencoder, with the other half left in
+    # float32 so that the quantized half is the only difference between the two
+    if case.endswith('_encoder'):
+        decoder = WAnet.inference.load_model(case[:-len('encoder')]+'decoder')
+        return Chain(original, decoder), Chain(quantized, decoder)
+    if case.endswith('_decoder'):
+        encoder = WAnet.inference.load_model(case[:-len('decoder')]+'encoder')
+        return Chain(encoder, original), Chain(encoder, quantized)
+    return original, quantized
+
+
+def held_out_data():
+    # The held out quarter the trainers score on, as (new_geometry, new_curves, G, D, F)
+    import WAnet.training
+    curves, geometry, S, N, D, F, G, new_curves, new_geometry = WAnet.training.load_data(packed=True)
+    test = len(new_curves) - int(numpy.ceil(0.25 * len(new_curves)))
+    return new_geometry[test:], new_curves[test:], G, D, F
+
+
+def accuracy_report(cases, batch_size=1000, data=None):
+    # R2 of the float and int8 models on data, by default held_out_data(), with size and batch latency
+    geometry, curves, G, D, F = held_out_data() if data is None else data
+    inputs = {G * G * G: geometry, D * F: curves}
+
+    rows = []
+    for case in cases:
+        original = WAnet.inference.load_model(case)
+        quantized = WAnet.inference.load_model(case, quantized=True)
+        scored = _scored(case, original, quantized)
+        x = inputs[scored[0].input_shape[1]]
+        y = inputs[scored[0].output_shape[1]] if scored[0].input_shape[1] != scored[0].output_shape[1] else None
+        if scored[0].output_shape[1] == G * G * G:
+            loss, breakdown = 'bce', (None, None)
+        else:
+            loss, breakdown = 'mse', (D, F)
+
+        row = {'case': case}
+        # Latency is of the case alone, on a batch of what reaches it
+        batch = next(WAnet.voxels.batches(x, batch_size, numpy.float32))
+        for model in getattr(scored[0], 'models', ()):
+            if model is original:
+                break
+            batch = model.predict(batch, batch_size=batch_size)
+        for name, model, chain in (('float32', original, scored[0]), ('int8', quantized, scored[1])):
+            results = WAnet.metrics.evaluate(chain, x, y, loss, breakdown[0], breakdown[1], batch_size)
+            row[name] = {'r2': float(results['r2']), 'bytes': _model_bytes(model),
+                         'batch_seconds': _latency(model, batch)}
+        rows.append(row)
+
+    return rows
+
+
+def table(rows):
+    lines = ['Case'.ljust(28) + ''.join(column.rjust(14) for column in ('R2 float32', 'R2 int8', 'MB float32', 'MB int8',
+                                                                     'ms float32', 'ms int8'))]
+    for row in rows:
+        lines.append(row['case'].ljust(28) +
+                     ''.join('{:14.5f}'.format(row[name]['r2']) for name in ('float32', 'int8')) +
+                     ''.join('{:14.2f}'.format(row[name]['bytes'] / 1e6) for name in ('float32', 'int8')) +
+                     ''.join('{:14.2f}'.format(1000 * row[name]['batch_seconds']) for name in ('float32', 'int8')))
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Quantize saved WAnet models to int8 and compare their accuracy.')
+    parser.add_argument('cases', nargs='+', help='trained_models prefixes, e.g. 16forward')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--no-report', action='store_true', help='only write the int8 weights')
+    args = parser.parse_args(argv)
+
+    for case in args.cases:
+        print("Wrote "+quantize(case))
+    if not args.no_report:
+        print(table(accuracy_report(args.cases, args.batch_size)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import WAnet.showing
+import hashlib
+import json
+import matplotlib.pyplot
+import multiprocessing
+import numpy
+import os
+import pkg_resources
+
+
+def weights_hash(case, models=None):
+    # Changes whenever the model is retrained
+    if models is None:
+        models = pkg_resources.resource_filename('WAnet', 'trained_models')
+    digest = hashlib.sha1()
+    for suffix in ('_structure.yml', '_weights.h5'):
+        with open(os.path.join(models, case+suffix), 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+def figure_key(case, indices, settings, models=None):
+    description = json.dumps([case, weights_hash(case, models), [int(i) for i in indices], settings], sort_keys=True)
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+def _init_worker():
+    # Workers never open windows
+    matplotlib.pyplot.switch_backend('Agg')
+
+
+def _render(job):
+    case, indices, settings, filename = job
+    WAnet.showing.plot_examples(case, settings['nx'], settings['ny'], settings['quick'], settings['renderer'],
+                                settings['dpi'], indices, filename)
+    return filename
+
+
+def build_report(cases=('geometry_autoencoder', 'curve_autoencoder', 'forward', 'inverse'), latent_dims=None,
+                 nx=2, ny=3, indices=None, quick=True, renderer='faces', dpi=300, processes=None, seed=None,
+                 directory=None):
+    # Example figures for every case at every latent size, rendered in parallel and reused while the weights,
+    # indices and settings stay the same
+    if latent_dims is not None:
+        cases = [str(latent_dim)+case for latent_dim in latent_dims for case in cases]
+
+    # The same examples for every model, so that the figures compare
+    if indices is None:
+        constants = numpy.load(pkg_resources.resource_filename('WAnet', 'data/compiled_data/constants.npz'))
+        indices = numpy.random.RandomState(seed).randint(1, int(constants['S'] * constants['N']), nx * ny)
+    indices = [int(i) for i in indices]
+    settings = {'nx': nx, 'ny': ny, 'quick': quick, 'renderer': renderer, 'dpi': dpi}
+
+    if directory is None:
+        directory = pkg_resources.resource_filename('WAnet', 'figures/report')
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    figures = []
+    jobs = []
+    for case in cases:
+        filename = os.path.join(directory, case+'_'+figure_key(case, indices, settings)+'.png')
+        figures.append((case, filename))
+        if not os.path.exists(filename):
+            jobs.append((case, indices, settings, filename))
+
+    # A single process renders here, without the cost of a pool
+    if jobs and processes == 1:
+        for job in jobs:
+            _render(job)
+    elif jobs:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker)
+        try:
+            pool.map(_render, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    # One page to flip through
+    with open(os.path.join(directory, 'index.html'), 'w') as file:
+        file.write('<html><body>\n')
+        for case, filename in figures:
+            file.write('<h2>'+case+'</h2>\n<img src="'+os.path.basename(filename)+'" width="100%">\n')
+        file.write('</body></html>\n')
+
+    return figures
@@ -0,0 +1,49 @@
+import WAnet.evaluating
+import WAnet.preprocessing
+import numpy
+
+
+def draw_candidates(number_of_draws, random=numpy.random):
+    # Uniform draws inside the limits used by preprocessing.generate_data, spread evenly over the shapes
+    candidates = []
+    shapes = list(WAnet.preprocessing.GEOMETRIES)
+    for i in range(number_of_draws):
+        shape = shapes[i % len(shapes)]
+        limits = WAnet.preprocessing.GEOMETRIES[shape]["vars"].values()
+        candidates.append((shape, [random.uniform(low, high) for low, high in limits]))
+
+    return candidates
+
+
+def select_candidates(evaluator, candidates, batch_size):
+    # Most uncertain candidates first, by ensemble spread and then by reconstruction error
+    geometry = WAnet.preprocessing.voxelize_batch(candidates, evaluator.G, packed=True)
+    curves, spread, reconstruction = evaluator.score(geometry)
+    order = numpy.lexsort((-reconstruction, -spread))[:batch_size]
+
+    return [candidates[i] for i in order], spread[order]
+
+
+def generate_data_active(rounds=10, batch_size=50, pool_size=5000, target_r2=0.95, latent_dims=(2, 4, 8, 16, 32),
+                         epochs=25, autoencoder_dim=None, G=32, seed=None):
+    import WAnet.training
+    random = numpy.random.RandomState(seed)
+
+    history = []
+    for current_round in range(rounds):
+        # Update the surrogates on every primitive case solved so far. Meshes solved elsewhere in the corpus are left
+        # out, as generate_data never draws them.
+        WAnet.preprocessing.extract_data(G=G, cases=WAnet.preprocessing.case_names())
+        r2 = [WAnet.training.train_forward_network(epochs, latent_dim, True, False) for latent_dim in latent_dims]
+        history.append(min(r2))
+        print("Round "+str(current_round)+" R2: "+str(min(r2)))
+        if min(r2) >= target_r2:
+            break
+
+        # Solve the cases the ensemble disagrees on the most
+        evaluator = WAnet.evaluating.HybridEvaluator(latent_dims, autoencoder_dim)
+        selected, spread = select_candidates(evaluator, draw_candidates(pool_size, random), batch_size)
+        for shape, dimensions in selected:
+            WAnet.preprocessing.solve_shape(shape, dimensions, WAnet.preprocessing.new_case_dir(shape))
+
+    return history
@@ -1,9 +1,18 @@
 from mpl_toolkits.mplot3d import Axes3D
-import WAnet.application
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+import WAnet.preprocessing
+import WAnet.voxels
+import matplotlib.colors
 import matplotlib.pyplot
 import numpy
 import pkg_resources
 
+# Voxels above this are drawn as filled
+THRESHOLD = 0.51
+
+# Direction the exposed faces are lit from
+LIGHT = numpy.array([-1.0, -1.0, 2.0]) / numpy.sqrt(6.0)
+
 
 def _cuboid_data(pos, size=(1, 1, 1)):
     # code taken from
@@ -29,30 +38,50 @@ def _cuboid_data(pos, size=(1, 1, 1)):
 
 def _plot_cube(position=(0, 0, 0), ax=None, color='b', size=1):
     x, y, z = _cuboid_data(position, size=(size, size, size))
-    ax.plot_surface(x, y, z, color=color, rstride=1, cstride=1)
+    ax.plot_surface(numpy.array(x), numpy.array(y), numpy.array(z), color=color, rstride=1, cstride=1)
 
 
 def _plot_dot(position=(0, 0, 0), ax=None, color='b'):
     ax.scatter(position[0], position[1], position[2], color=color)
 
 
-def plot_voxels(ax, matrix, color, quick, axes_off, xyz=None):
-    # plot a Matrix
-    for i in range(matrix.shape[0]):
-        for j in range(matrix.shape[1]):
-            for k in range(matrix.shape[2]):
-                if matrix[i, j, k] > 0.51:
-                    if quick:
-                        _plot_dot(position=(i-0.5, j-0.5, k-0.5), ax=ax, color=color)
-                    else:
-                        if xyz is not None:
-                            x = xyz[0]
-                            y = xyz[1]
-                            z = xyz[2]
-                            ex = abs(x[0]-x[1])
-                            _plot_cube(position=(x[i]-0.5*ex, y[j]-0.5*ex, z[k]-0.5*ex), ax=ax, color=color, size=ex)
-                        else:
-                            _plot_cube(position=(i-0.5, j-0.5, k-0.5), ax=ax, color=color)
+def _plot_faces(ax, matrix, color, xyz=None):
+    # Every exposed face in one collection, interior faces are never built
+    corners, normals = WAnet.voxels.exposed_faces(matrix, THRESHOLD)
+
+    # Cell i spans [i - 1, i], or [x[i] - ex, x[i]], as with _plot_cube
+    if xyz is not None:
+        ex = abs(xyz[0][0] - xyz[0][1])
+        corners = numpy.array([xyz[0][0], xyz[1][0], xyz[2][0]]) + (corners - 1) * ex
+    else:
+        corners = corners - 1.0
+
+    # Flat shading, darker the further a face turns from the light
+    shade = 0.6 + 0.4 * numpy.clip(numpy.dot(normals, LIGHT), 0, 1)
+    colors = numpy.tile(matplotlib.colors.to_rgba(color), (len(shade), 1))
+    colors[:, :3] *= shade[:, None]
+    ax.add_collection3d(Poly3DCollection(corners, facecolors=colors, edgecolors='none'))
+
+
+def plot_voxels(ax, matrix, color, quick, axes_off, xyz=None, renderer='faces'):
+    # plot a Matrix, as dots when quick, otherwise as exposed faces or with the original cube per voxel
+    if quick:
+        i, j, k = numpy.nonzero(matrix > THRESHOLD)
+        ax.scatter(i-0.5, j-0.5, k-0.5, color=color)
+    elif renderer == 'faces':
+        _plot_faces(ax, matrix, color, xyz)
+    elif renderer == 'cubes':
+        for i, j, k in zip(*numpy.nonzero(matrix > THRESHOLD)):
+            if xyz is not None:
+                x = xyz[0]
+                y = xyz[1]
+                z = xyz[2]
+                ex = abs(x[0]-x[1])
+                _plot_cube(position=(x[i]-0.5*ex, y[j]-0.5*ex, z[k]-0.5*ex), ax=ax, color=color, size=ex)
+            else:
+                _plot_cube(position=(i-0.5, j-0.5, k-0.5), ax=ax, color=color)
+    else:
+        raise ValueError("Unknown renderer "+str(renderer)+", expected 'faces' or 'cubes'")
 
     if axes_off:
         ax.set_xticklabels([])
@@ -97,20 +126,26 @@ def plot_curves(ax, true, line_style, topper, axes_off, x=None):
     ax.set_aspect((x1 - x0) / (y1 - y0))
 
 
-def plot_examples(case, nx, ny, quick=True):
-    # Load network
+def plot_examples(case, nx, ny, quick=True, renderer='faces', dpi=1000, indices=None, filename=None):
+    # Load network, which brings in keras
+    import WAnet.application
     structure = pkg_resources.resource_filename("WAnet", "trained_models/"+case+"_structure.yml")
     weights = pkg_resources.resource_filename("WAnet", "trained_models/"+case+"_weights.h5")
     nw = WAnet.application.Network(structure, weights)
 
     # Find out if its an autoencoder or a predictor
-    if nw.network.layers[0].input_shape[1] == nw.network.layers[-1].output_shape[1]:
+    if nw.network.input_shape[1] == nw.network.output_shape[1]:
         mult = 2
     else:
         mult = 3
 
-    for i in range(1, nx*ny*mult, mult):
-        [_, ip, ot, op] = nw.prediction()
+    # Random cases unless they are given, one per example
+    if indices is None:
+        indices = [None] * (nx * ny)
+
+    figure = matplotlib.pyplot.figure()
+    for i, case_idx in zip(range(1, nx*ny*mult, mult), indices):
+        [_, ip, ot, op] = nw.prediction(case_idx)
         idx = i
 
         y_top = 0
@@ -126,7 +161,7 @@ def plot_examples(case, nx, ny, quick=True):
         # Plot input
         if len(ip.flatten()) == pow(nw.G, 3):
             ax = matplotlib.pyplot.subplot(ny, nx * mult, idx, projection='3d')
-            plot_voxels(ax, ip, 'b', quick, True)
+            plot_voxels(ax, ip, 'b', quick, True, renderer=renderer)
         else:
             ax = matplotlib.pyplot.subplot(ny, nx * mult, idx)
             plot_curves(ax, ip, '-', y_top, True)
@@ -136,7 +171,7 @@ def plot_examples(case, nx, ny, quick=True):
             idx = idx + 1
             if len(op.flatten()) == pow(nw.G, 3):
                 ax = matplotlib.pyplot.subplot(ny, nx * mult, idx, projection='3d')
-                plot_voxels(ax, ot, 'b', quick, True)
+                plot_voxels(ax, ot, 'b', quick, True, renderer=renderer)
             else:
                 ax = matplotlib.pyplot.subplot(ny, nx*mult, idx)
                 plot_curves(ax, ot, '-', y_top, True)
@@ -145,15 +180,20 @@ def plot_examples(case, nx, ny, quick=True):
         idx = idx + 1
         if len(op.flatten()) == pow(nw.G, 3):
             ax = matplotlib.pyplot.subplot(ny, nx * mult, idx, projection='3d')
-            plot_voxels(ax, op, 'g', quick, True)
+            plot_voxels(ax, op, 'g', quick, True, renderer=renderer)
         else:
             ax = matplotlib.pyplot.subplot(ny, nx*mult, idx)
             plot_curves(ax, op, '--', y_top, True)
 
-    matplotlib.pyplot.savefig(pkg_resources.resource_filename("WAnet", "figures/"+case+"_examples.png"), dpi=1000)
+    if filename is None:
+        filename = pkg_resources.resource_filename("WAnet", "figures/"+case+"_examples.png")
+    matplotlib.pyplot.savefig(filename, dpi=dpi)
+    matplotlib.pyplot.close(figure)
+
+    return filename
 
 
-def plot_BIEM_example():
+def plot_BIEM_example(renderer='faces', dpi=1000):
     curves, geometry, S, N, D, F, G, new_curves, new_geometry = WAnet.training.load_data()
     idx = numpy.random.randint(1, S*N)
 
@@ -165,17 +205,16 @@ def plot_BIEM_example():
     matplotlib.pyplot.legend(['Surge', 'Heave', 'Pitch'])
 
     matplotlib.pyplot.tight_layout()
-    matplotlib.pyplot.savefig(pkg_resources.resource_filename("WAnet", "figures/BIEM_example_curve.png"), dpi=1000)
+    matplotlib.pyplot.savefig(pkg_resources.resource_filename("WAnet", "figures/BIEM_example_curve.png"), dpi=dpi)
 
     ax = matplotlib.pyplot.subplot(1, 2, 1, projection='3d')
-    ex = 5 - 5 / G
-    xyz = (numpy.linspace(-ex, ex, G), numpy.linspace(-ex, ex, G), numpy.linspace(-(9.5 - 5 / G), 0.5 - 5 / G, G))
-    plot_voxels(ax, new_geometry[idx].reshape((G, G, G), order='F'), 'b', False, False, xyz)
+    xyz = WAnet.preprocessing.make_grid_axes(G)
+    plot_voxels(ax, new_geometry[idx].reshape((G, G, G), order='F'), 'b', False, False, xyz, renderer)
     ax.set_xlabel('x ($m$)')
     ax.set_ylabel('y ($m$)')
     ax.set_zlabel('z ($m$)')
 
     matplotlib.pyplot.tight_layout()
-    matplotlib.pyplot.savefig(pkg_resources.resource_filename("WAnet", "figures/BIEM_example_geometry.png"), dpi=1000)
+    matplotlib.pyplot.savefig(pkg_resources.resource_filename("WAnet", "figures/BIEM_example_geometry.png"), dpi=dpi)
 
 
@@ -1,42 +1,301 @@
+import json
 import keras
-import sklearn.model_selection
 import numpy
 import pkg_resources
 import os
+import sys
+import time
+import WAnet.metrics
+import WAnet.voxels
+
+# resource is Unix only, on Windows the peak memory comes from psutil if it is installed
+try:
+    import resource
+except ImportError:
+    resource = None
 
 VERBOSE = 1
 
-def load_data():
-    curves = numpy.load(pkg_resources.resource_filename('WAnet', 'data/compiled_data/data_curves.npz'))['curves']
-    geometry = numpy.load(pkg_resources.resource_filename('WAnet', 'data/compiled_data/data_geometry.npz'))['geometry']
-    constants = numpy.load(pkg_resources.resource_filename('WAnet', 'data/compiled_data/constants.npz'))
+# Storage precision of the arrays from load_data, one of PRECISIONS
+PRECISION = 'float32'
+PRECISIONS = ('float16', 'float32', 'float64')
+
+
+def set_precision(precision):
+    # float16 is a storage format only, batches are widened to float32 before they reach the network
+    global PRECISION
+    if precision not in PRECISIONS:
+        raise ValueError("Unknown precision "+str(precision)+", expected one of "+str(PRECISIONS))
+    PRECISION = precision
+    keras.backend.set_floatx('float64' if precision == 'float64' else 'float32')
+
+
+def dense(data):
+    # A dense array at the precision the network computes in, from packed geometry or stored data
+    if isinstance(data, WAnet.voxels.PackedVoxels):
+        return data.unpack(keras.backend.floatx())
+    return numpy.asarray(data, dtype=keras.backend.floatx())
+
+
+def load_data(packed=False, precision=None, directory=None):
+    dtype = PRECISION if precision is None else precision
+    if directory is None:
+        directory = pkg_resources.resource_filename('WAnet', 'data/compiled_data')
+
+    curves = numpy.load(os.path.join(directory, 'data_curves.npz'))['curves']
+    geometry = numpy.load(os.path.join(directory, 'data_geometry.npz'))
+    constants = numpy.load(os.path.join(directory, 'constants.npz'))
     S = constants['S']
     N = constants['N']
     D = constants['D']
     F = constants['F']
     G = constants['G']
 
-    new_curves = numpy.zeros((S*N, D * F))
-    for i, curveset in enumerate(curves):
-        new_curves[i, :] = curveset.T.flatten() / 1000000
+    # Cast once here rather than on every batch
+    new_curves = (curves[:S*N].transpose(0, 2, 1).reshape(S*N, D * F) / 1000000).astype(dtype)
+
+    # Geometry is kept bit-packed and only unpacked where a dense array is needed
+    if 'packed' in geometry:
+        geometry = WAnet.voxels.PackedVoxels(geometry['packed'], G)
+    else:
+        geometry = geometry['geometry']
+        geometry = WAnet.voxels.PackedVoxels.from_dense(geometry[..., 0].transpose(0, 3, 2, 1).reshape(len(geometry), -1), G)
 
-    new_geometry = numpy.zeros((S*N, G * G * G))
-    for i, geometryset in enumerate(geometry):
-        new_geometry[i, :] = geometryset.T.flatten()
+    if packed:
+        new_geometry = geometry
+    else:
+        new_geometry = geometry.unpack(dtype)
 
     return curves, geometry, S, N, D, F, G, new_curves, new_geometry
 
 
-def train_geometry_autoencoder(epochs, latent_dim, save_results, print_network):
-    curves, geometry, S, N, D, F, G, new_curves, new_geometry = load_data()
+def load_mask(directory=None):
+    # Active voxels of the data set, worked out on first use for data compiled before extract_data saved them
+    if directory is None:
+        directory = pkg_resources.resource_filename('WAnet', 'data/compiled_data')
+    filename = os.path.join(directory, 'voxel_mask.npz')
+    if not os.path.exists(filename):
+        G = int(numpy.load(os.path.join(directory, 'constants.npz'))['G'])
+        WAnet.voxels.VoxelMask.from_data(WAnet.voxels.load(os.path.join(directory, 'data_geometry.npz')), G).save(filename)
+
+    return WAnet.voxels.load_mask(filename)
+
+
+def load_names():
+    # Case directory names in the same order as the rows of load_data
+    return numpy.load(pkg_resources.resource_filename('WAnet', 'data/compiled_data/data_curves.npz'))['names']
+
+
+class VoxelSequence(keras.utils.Sequence):
+    # Unpacks geometry one batch at a time, right before it reaches the network
+    def __init__(self, x, y=None, batch_size=32, shuffle=False):
+        self.x = x
+        self.y = y
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.order = numpy.arange(len(x))
+        self.on_epoch_end()
+
+    def __len__(self):
+        return int(numpy.ceil(len(self.x) / float(self.batch_size)))
+
+    def _batch(self, data, idx):
+        return dense(data[idx])
+
+    def __getitem__(self, i):
+        idx = numpy.sort(self.order[(i * self.batch_size):((i + 1) * self.batch_size)])
+        if self.y is None:
+            return self._batch(self.x, idx), None
+        return self._batch(self.x, idx), self._batch(self.y, idx)
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            numpy.random.shuffle(self.order)
+
+
+class TrainingState(keras.callbacks.Callback):
+    # Full training state every few epochs, so that an interrupted run can carry on where it stopped
+    def __init__(self, role, latent_dim='', checkpoint=None, period=1):
+        super(TrainingState, self).__init__()
+        self.prefix = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+role+'_state')
+        self.checkpoint = checkpoint
+        self.period = period
+
+    def _files(self):
+        return self.prefix+'_weights.h5', self.prefix+'.npz'
+
+    def save(self, epoch):
+        weights, state = self._files()
+        rng = numpy.random.get_state()
+        optimizer = keras.backend.batch_get_value(self.model.optimizer.weights)
+        best = numpy.inf if self.checkpoint is None else self.checkpoint.best
+
+        # Write next to the old state and swap, so that a kill mid-save leaves the previous state intact
+        self.model.save_weights(weights+'.tmp')
+        with open(state+'.tmp', 'wb') as file:
+            numpy.savez(file, epoch=epoch, best=best, lr=keras.backend.get_value(self.model.optimizer.lr),
+                        rng_keys=rng[1], rng_pos=rng[2], rng_has_gauss=rng[3], rng_cached_gaussian=rng[4],
+                        optimizer_count=len(optimizer),
+                        **{'optimizer_'+str(i): value for i, value in enumerate(optimizer)})
+        os.replace(weights+'.tmp', weights)
+        os.replace(state+'.tmp', state)
+
+    def restore(self, model):
+        # Returns the epoch to start from, 0 when there is nothing to resume
+        weights, state = self._files()
+        if not os.path.exists(state):
+            return 0
+
+        data = numpy.load(state)
+        model.load_weights(weights)
+        if int(data['optimizer_count']):
+            # Optimizer slots only exist once the training function is built
+            model._make_train_function()
+            model.optimizer.set_weights([data['optimizer_'+str(i)] for i in range(int(data['optimizer_count']))])
+        keras.backend.set_value(model.optimizer.lr, float(data['lr']))
+        numpy.random.set_state(('MT19937', data['rng_keys'], int(data['rng_pos']), int(data['rng_has_gauss']),
+                                float(data['rng_cached_gaussian'])))
+        if self.checkpoint is not None:
+            self.checkpoint.best = float(data['best'])
+
+        return int(data['epoch'])
+
+    def clear(self):
+        for filename in self._files():
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def on_epoch_end(self, epoch, logs=None):
+        if (epoch + 1) % self.period == 0:
+            self.save(epoch + 1)
+
+
+class TimeBudget(keras.callbacks.Callback):
+    # Stops training before an epoch that would run past the budget, in seconds
+    def __init__(self, seconds):
+        super(TimeBudget, self).__init__()
+        self.seconds = seconds
+
+    def on_train_begin(self, logs=None):
+        self.start = time.time()
+        self.epochs = 0
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epochs += 1
+        elapsed = time.time() - self.start
+        if elapsed + elapsed / self.epochs > self.seconds:
+            self.model.stop_training = True
+
+
+class TrainingLogger(keras.callbacks.CSVLogger):
+    # CSVLogger that also records the learning rate and marks the epoch training stopped at
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs if logs is not None else {}
+        logs['lr'] = float(keras.backend.get_value(self.model.optimizer.lr))
+        logs['stopped'] = int(self.model.stop_training or epoch + 1 >= self.params['epochs'])
+        super(TrainingLogger, self).on_epoch_end(epoch, logs)
+
+
+def _peak_rss():
+    # Peak resident set size of this process in MB, or None where it cannot be read. ru_maxrss is in bytes on macOS
+    # and in kB on Linux and the other Unixes.
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024.0 ** 2 if sys.platform == 'darwin' else peak / 1024.0
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    return getattr(memory, 'peak_wset', memory.rss) / 1024.0 ** 2
+
+
+def _count_params(weights):
+    return int(sum(numpy.prod(keras.backend.int_shape(weight)) for weight in weights))
+
+
+class Instrumentation(keras.callbacks.Callback):
+    # Wall time, throughput and memory of every epoch
+    def __init__(self, samples):
+        super(Instrumentation, self).__init__()
+        self.samples = samples
+        self.epochs = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.started = time.time()
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.time() - self.started
+        self.epochs.append({'epoch': epoch, 'seconds': seconds, 'samples_per_second': self.samples / seconds,
+                            'peak_rss_mb': _peak_rss()})
+
+
+def _convergence_callbacks(logger, patience=None, time_budget=None, append=False):
+    # The best weights are kept by ModelCheckpoint, so stopping early never costs final accuracy
+    callbacks = []
+    if patience is not None:
+        callbacks.append(keras.callbacks.EarlyStopping(patience=patience, verbose=VERBOSE))
+        callbacks.append(keras.callbacks.ReduceLROnPlateau(factor=0.5, patience=max(1, patience // 2), verbose=VERBOSE))
+    if time_budget is not None:
+        callbacks.append(TimeBudget(time_budget))
+
+    # Last, so that it sees whether one of the above stopped training
+    callbacks.append(TrainingLogger(logger, separator=',', append=append))
+    return callbacks
+
+
+def _conv_encoder(x, G, intermediate_dim):
+    # Three strided convolutions bring the grid down to (G/8)^3 before the dense layers
+    c = keras.layers.Reshape((G, G, G, 1))(x)
+    c = keras.layers.Conv3D(8, 3, strides=2, padding='same', activation='relu')(c)
+    c = keras.layers.Conv3D(16, 3, strides=2, padding='same', activation='relu')(c)
+    c = keras.layers.Conv3D(32, 3, strides=2, padding='same', activation='relu')(c)
+    return keras.layers.Dense(intermediate_dim, activation='relu')(keras.layers.Flatten()(c))
+
+
+def _conv_decoder_layers(G, intermediate_dim):
+    # Mirror of _conv_encoder, ending in a flattened grid like the dense decoder
+    return [keras.layers.Dense(intermediate_dim, activation='relu'),
+            keras.layers.Dense(32 * (G // 8) ** 3, activation='relu'),
+            keras.layers.Reshape((G // 8, G // 8, G // 8, 32)),
+            keras.layers.Conv3DTranspose(16, 3, strides=2, padding='same', activation='relu'),
+            keras.layers.Conv3DTranspose(8, 3, strides=2, padding='same', activation='relu'),
+            keras.layers.Conv3DTranspose(1, 3, strides=2, padding='same', activation='sigmoid'),
+            keras.layers.Reshape((G * G * G,))]
+
 
-    batch_size = 100
-    original_dim = G*G*G
-    intermediate_dim = 256
-    epsilon_std = 1.0
+def _is_conv(model):
+    # Conv3DTranspose subclasses Conv3D, so this catches encoders and decoders alike
+    return any(isinstance(layer, keras.layers.Conv3D) for layer in model.layers)
+
+
+def _load_saved(name):
+    temp = open(pkg_resources.resource_filename('WAnet', 'trained_models/'+name+'_structure.yml'), 'r')
+    model = keras.models.model_from_yaml(temp.read())
+    temp.close()
+    model.load_weights(pkg_resources.resource_filename('WAnet', 'trained_models/'+name+'_weights.h5'))
+    return model
 
+
+def _load_saved_mask(name):
+    # The voxel mask a saved model was trained with, or None for models of the full grid
+    filename = pkg_resources.resource_filename('WAnet', 'trained_models/'+name+'_mask.npz')
+    return WAnet.voxels.load_mask(filename) if os.path.exists(filename) else None
+
+
+def _freeze(model, layers, trained):
+    # Copy pretrained weights into layers and freeze them. Keras only reads trainable when compiling, so this has to
+    # happen before the model using them is compiled.
+    model.trainable = False
+    for layer, source in zip(layers, trained):
+        layer.set_weights(source.get_weights())
+        layer.trainable = False
+
+
+def _build_vae(original_dim, latent_dim, encode, decoder_layers, reconstruction, epsilon_std=1.0):
+    # Variational autoencoder around an encoder function and a list of decoder layers
     x = keras.layers.Input(shape=(original_dim,))
-    h = keras.layers.Dense(intermediate_dim, activation='relu')(x)
+    h = encode(x)
     z_mean = keras.layers.Dense(latent_dim)(h)
     z_log_var = keras.layers.Dense(latent_dim)(h)
 
@@ -49,11 +308,12 @@ def train_geometry_autoencoder(epochs, latent_dim, save_results, print_network):
     # note that "output_shape" isn't necessary with the TensorFlow backend
     z = keras.layers.Lambda(sampling, output_shape=(latent_dim,))([z_mean, z_log_var])
 
-    # we instantiate these layers separately so as to reuse them later
-    decoder_h = keras.layers.Dense(intermediate_dim, activation='relu')
-    decoder_mean = keras.layers.Dense(original_dim, activation='sigmoid')
-    h_decoded = decoder_h(z)
-    x_decoded_mean = decoder_mean(h_decoded)
+    def decode(tensor):
+        for layer in decoder_layers:
+            tensor = layer(tensor)
+        return tensor
+
+    x_decoded_mean = decode(z)
 
     # Custom loss layer
     class CustomVariationalLayer(keras.layers.Layer):
@@ -62,7 +322,7 @@ def train_geometry_autoencoder(epochs, latent_dim, save_results, print_network):
             super(CustomVariationalLayer, self).__init__(**kwargs)
 
         def vae_loss(self, x, x_decoded_mean):
-            xent_loss = original_dim * keras.metrics.binary_crossentropy(x, x_decoded_mean)
+            xent_loss = original_dim * reconstruction(x, x_decoded_mean)
             kl_loss = - 0.5 * keras.backend.sum(1 + z_log_var - keras.backend.square(z_mean) - keras.backend.exp(z_log_var), axis=-1)
             return keras.backend.mean(xent_loss + kl_loss)
 
@@ -78,430 +338,327 @@ def train_geometry_autoencoder(epochs, latent_dim, save_results, print_network):
     vae = keras.models.Model(x, y)
     vae.compile(optimizer='rmsprop', loss=None)
 
-    x_train, x_test = sklearn.model_selection.train_test_split(new_geometry, shuffle=False)
-
-    weights = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'temp_vae_weights.h5')
-    logger = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'geometry_vae_training.csv')
-    vae.fit(x_train,
-            shuffle=True,
-            epochs=epochs,
-            batch_size=batch_size,
-            validation_data=(x_test, None),
-            verbose=VERBOSE,
-            callbacks=[keras.callbacks.ModelCheckpoint(filepath=weights, verbose=VERBOSE, save_best_only=True),
-                       keras.callbacks.CSVLogger(logger, separator=',', append=False)])
-
-    vae.load_weights(weights)
-    os.remove(weights)
-
     # build a model to project inputs on the latent space
     encoder = keras.models.Model(x, z_mean)
 
     # build a digit generator that can sample from the learned distribution
     decoder_input = keras.layers.Input(shape=(latent_dim,))
-    _h_decoded = decoder_h(decoder_input)
-    _x_decoded_mean = decoder_mean(_h_decoded)
-    generator = keras.models.Model(decoder_input, _x_decoded_mean)
-
-    # Build and save the autoencoder
-    _h_decoded2 = decoder_h(z_mean)
-    _x_decoded_mean2 = decoder_mean(_h_decoded2)
-    autoencoder = keras.models.Model(x, _x_decoded_mean2)
-
-    structure = []
-    weights = []
-    if save_results:
-        # Save encoder structure and weights
-        temp = open(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'geometry_encoder_structure.yml'), 'w')
-        temp.write(encoder.to_yaml())
-        temp.close()
-        encoder.save_weights(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'geometry_encoder_weights.h5'))
-
-        # Save decoder structure and weights
-        temp = open(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'geometry_decoder_structure.yml'), 'w')
-        temp.write(generator.to_yaml())
-        temp.close()
-        generator.save_weights(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'geometry_decoder_weights.h5'))
-
-        # Save full autoencoder structure and weights
-        structure = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'geometry_autoencoder_structure.yml')
-        weights = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'geometry_autoencoder_weights.h5')
-        temp = open(structure, 'w')
-        temp.write(autoencoder.to_yaml())
-        temp.close()
-        autoencoder.save_weights(weights)
-
-    if print_network:
-        keras.utils.plot_model(generator, to_file=pkg_resources.resource_filename('WAnet', 'figures/'+str(latent_dim)+'geometry_decoder.eps'), show_shapes=True)
-        keras.utils.plot_model(encoder, to_file=pkg_resources.resource_filename('WAnet', 'figures/'+str(latent_dim)+'geometry_encoder.eps'), show_shapes=True)
-        keras.utils.plot_model(autoencoder, to_file=pkg_resources.resource_filename('WAnet', 'figures/'+str(latent_dim)+'geometry_autoencoder.eps'), show_shapes=True)
-
-    # Final check on metrics
-    x_pred = autoencoder.predict(x_test)
-    mse = keras.backend.mean(keras.losses.binary_crossentropy(x_pred, x_test)).eval()
-    x_pred.fill(numpy.mean(x_test.flatten()))
-    s2 = keras.backend.mean(keras.losses.binary_crossentropy(x_pred, x_test)).eval()
-    r2 = 1-mse/s2
-    print("Final BCE: "+str(mse))
-    print("Final S2: "+str(s2))
-    print("Final R2: "+str(r2))
-    return r2
-
-
-def train_response_autoencoder(epochs, latent_dim, save_results, print_network):
-    curves, geometry, S, N, D, F, G, new_curves, new_geometry = load_data()
-
-    batch_size = 10
-    original_dim = D*F
-    intermediate_dim = 64
-    epsilon_std = 1.0
-
-    x = keras.layers.Input(shape=(original_dim,))
-    h = keras.layers.Dense(intermediate_dim, activation='relu')(x)
-    z_mean = keras.layers.Dense(latent_dim)(h)
-    z_log_var = keras.layers.Dense(latent_dim)(h)
-
-    def sampling(args):
-        z_mean, z_log_var = args
-        epsilon = keras.backend.random_normal(shape=(keras.backend.shape(z_mean)[0], latent_dim), mean=0.,
-                                  stddev=epsilon_std)
-        return z_mean + keras.backend.exp(z_log_var / 2) * epsilon
-
-    # note that "output_shape" isn't necessary with the TensorFlow backend
-    z = keras.layers.Lambda(sampling, output_shape=(latent_dim,))([z_mean, z_log_var])
-
-    # we instantiate these layers separately so as to reuse them later
-    decoder_h = keras.layers.Dense(intermediate_dim, activation='relu')
-    decoder_mean = keras.layers.Dense(original_dim, activation='sigmoid')
-    h_decoded = decoder_h(z)
-    x_decoded_mean = decoder_mean(h_decoded)
-
-    # Custom loss layer
-    class CustomVariationalLayer(keras.layers.Layer):
-        def __init__(self, **kwargs):
-            self.is_placeholder = True
-            super(CustomVariationalLayer, self).__init__(**kwargs)
+    generator = keras.models.Model(decoder_input, decode(decoder_input))
+
+    # Build the autoencoder, these share their layers with vae
+    autoencoder = keras.models.Model(x, decode(z_mean))
+
+    return vae, encoder, generator, autoencoder
+
+
+class Trainer(object):
+
+    def __init__(self, role, latent_dim, build, x, y=None, loss='mse', batch_size=32, shuffle=False, callbacks=None,
+                 breakdown=(None, None), load_seconds=None, mask=None):
+        # build returns the compiled training model and the (name, model) pairs to save, the last of which is scored.
+        # x and y may be dense arrays or PackedVoxels, and y is None for autoencoders.
+        # breakdown is (D, F) when the outputs are curves, for per-DoF and per-frequency errors.
+        # mask is the VoxelMask the geometry is cut down to, saved next to every model.
+        self.role = role
+        self.latent_dim = latent_dim
+        self.build = build
+        self.x = x
+        self.y = y
+        self.loss = loss
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.callbacks = list(callbacks) if callbacks is not None else []
+        self.breakdown = breakdown
+        self.mask = mask
+        self.profile = {'role': role, 'latent_dim': latent_dim, 'samples': len(x), 'batch_size': batch_size,
+                        'load_seconds': load_seconds, 'active_voxels': None if mask is None else mask.size}
+
+    def _path(self, name):
+        return pkg_resources.resource_filename('WAnet', 'trained_models/'+str(self.latent_dim)+name)
+
+    def split(self):
+        import sklearn.model_selection
+        if self.y is None:
+            x_train, x_test = sklearn.model_selection.train_test_split(self.x, shuffle=False)
+            return x_train, x_test, None, None
+        return sklearn.model_selection.train_test_split(self.x, self.y, shuffle=False)
+
+    def fit(self, model, epochs, resume=False, patience=None, time_budget=None):
+        # Trains on the first three quarters of the data and leaves model at the weights with the best validation loss
+        x_train, x_test, y_train, y_test = self.split()
+        weights = self._path('temp_'+self.role+'_weights.h5')
+        checkpoint = keras.callbacks.ModelCheckpoint(filepath=weights, verbose=VERBOSE, save_best_only=True)
+        state = TrainingState(self.role, self.latent_dim, checkpoint)
+        initial_epoch = state.restore(model) if resume else 0
+
+        instrumentation = Instrumentation(len(x_train))
+        callbacks = [checkpoint, instrumentation] + _convergence_callbacks(self._path(self.role+'_training.csv'), patience, time_budget,
+                                                          initial_epoch > 0)
+        model.fit_generator(VoxelSequence(x_train, y_train, self.batch_size, shuffle=self.shuffle),
+                            epochs=epochs,
+                            validation_data=VoxelSequence(x_test, y_test, self.batch_size),
+                            verbose=VERBOSE,
+                            shuffle=False,
+                            initial_epoch=initial_epoch,
+                            callbacks=callbacks + self.callbacks + [state])
+
+        model.load_weights(weights)
+        os.remove(weights)
+        state.clear()
+        self.profile['epochs'] = instrumentation.epochs
+
+        return x_test, y_test
+
+    def save(self, models):
+        for name, model in models:
+            temp = open(self._path(name+'_structure.yml'), 'w')
+            temp.write(model.to_yaml())
+            temp.close()
+            model.save_weights(self._path(name+'_weights.h5'))
+
+            # A mask left from an earlier run would no longer match the model
+            if self.mask is not None:
+                self.mask.save(self._path(name+'_mask.npz'))
+            elif os.path.exists(self._path(name+'_mask.npz')):
+                os.remove(self._path(name+'_mask.npz'))
+
+    def plot(self, models):
+        for name, model in models:
+            keras.utils.plot_model(model, to_file=pkg_resources.resource_filename('WAnet', 'figures/'+str(self.latent_dim)+name+'.eps'), show_shapes=True)
+
+    def score(self, model, x_test, y_test):
+        # R2 of the final model on the held out quarter, a batch at a time
+        results = WAnet.metrics.evaluate(model, x_test, y_test, self.loss, self.breakdown[0], self.breakdown[1],
+                                         dtype=keras.backend.floatx())
+        print("Final "+self.loss.upper()+": "+str(results['error']))
+        print("Final S2: "+str(results['s2']))
+        print("Final R2: "+str(results['r2']))
+        if 'r2_per_dof' in results:
+            print("Final R2 per DoF: "+str(results['r2_per_dof']))
+
+        return results['r2']
+
+    def _time(self, stage, function, *args):
+        started = time.time()
+        output = function(*args)
+        self.profile[stage+'_seconds'] = time.time() - started
+        return output
+
+    def report(self, models):
+        # Structured companion to the training csv, to compare configurations and runs
+        self.profile['peak_rss_mb'] = _peak_rss()
+        self.profile['models'] = {name: {'trainable_params': _count_params(model.trainable_weights),
+                                         'non_trainable_params': _count_params(model.non_trainable_weights)}
+                                  for name, model in models}
+        with open(self._path(self.role+'_profile.json'), 'w') as file:
+            json.dump(self.profile, file, indent=2)
+
+    def train(self, epochs, save_results, print_network, resume=False, patience=None, time_budget=None):
+        model, models = self._time('build', self.build)
+        x_test, y_test = self._time('fit', self.fit, model, epochs, resume, patience, time_budget)
+        if save_results:
+            self._time('save', self.save, models)
+        if print_network:
+            self.plot(models)
+
+        r2 = self._time('score', self.score, models[-1][1], x_test, y_test)
+        self.profile['r2'] = float(r2)
+        self.report(models)
+
+        return r2
+
+
+def build_geometry_vae(latent_dim, G, architecture='dense', mask=None):
+    # With a VoxelMask the autoencoder only sees the active voxels
+    original_dim = G*G*G if mask is None else mask.size
+    intermediate_dim = 256
 
-        def vae_loss(self, x, x_decoded_mean):
-            xent_loss = original_dim * keras.metrics.mean_squared_error(x, x_decoded_mean)
-            kl_loss = - 0.5 * keras.backend.sum(1 + z_log_var - keras.backend.square(z_mean) - keras.backend.exp(z_log_var), axis=-1)
-            return keras.backend.mean(xent_loss + kl_loss)
+    if architecture == 'conv' and G % 8 != 0:
+        raise ValueError("The convolutional autoencoder needs G to be a multiple of 8, not "+str(G))
+    if architecture == 'conv' and mask is not None:
+        raise ValueError("The convolutional autoencoder needs the full grid and cannot be masked")
 
-        def call(self, inputs):
-            x = inputs[0]
-            x_decoded_mean = inputs[1]
-            loss = self.vae_loss(x, x_decoded_mean)
-            self.add_loss(loss, inputs=inputs)
-            # We won't actually use the output.
-            return x
-
-    y = CustomVariationalLayer()([x, x_decoded_mean])
-    vae = keras.models.Model(x, y)
-    vae.compile(optimizer='rmsprop', loss=None)
+    if architecture == 'conv':
+        encode = lambda x: _conv_encoder(x, G, intermediate_dim)
+        decoder_layers = _conv_decoder_layers(G, intermediate_dim)
+    else:
+        encode = keras.layers.Dense(intermediate_dim, activation='relu')
+        decoder_layers = [keras.layers.Dense(intermediate_dim, activation='relu'),
+                          keras.layers.Dense(original_dim, activation='sigmoid')]
+    vae, encoder, generator, autoencoder = _build_vae(original_dim, latent_dim, encode, decoder_layers,
+                                                      keras.metrics.binary_crossentropy)
+    return vae, [('geometry_encoder', encoder), ('geometry_decoder', generator), ('geometry_autoencoder', autoencoder)]
 
-    # train the VAE on MNIST digits
-    x_train, x_test = sklearn.model_selection.train_test_split(new_curves, shuffle=False)
-    weights = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'temp_vae_weights.h5')
-    logger = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'curve_vae_training.csv')
 
-    vae.fit(x_train,
-            shuffle=True,
-            epochs=epochs,
-            batch_size=batch_size,
-            validation_data=(x_test, None),
-            verbose=VERBOSE,
-            callbacks=[keras.callbacks.ModelCheckpoint(filepath=weights, verbose=VERBOSE, save_best_only=True),
-                       keras.callbacks.CSVLogger(logger, separator=',', append=False)])
+def build_response_vae(latent_dim, D, F):
+    original_dim = D*F
+    intermediate_dim = 64
 
-    vae.load_weights(weights)
-    os.remove(weights)
+    encode = keras.layers.Dense(intermediate_dim, activation='relu')
+    decoder_layers = [keras.layers.Dense(intermediate_dim, activation='relu'),
+                      keras.layers.Dense(original_dim, activation='sigmoid')]
+    vae, encoder, generator, autoencoder = _build_vae(original_dim, latent_dim, encode, decoder_layers,
+                                                      keras.metrics.mean_squared_error)
+    return vae, [('curve_encoder', encoder), ('curve_decoder', generator), ('curve_autoencoder', autoencoder)]
 
-    # build a model to project inputs on the latent space
-    encoder = keras.models.Model(x, z_mean)
 
-    # build a digit generator that can sample from the learned distribution
-    decoder_input = keras.layers.Input(shape=(latent_dim,))
-    _h_decoded = decoder_h(decoder_input)
-    _x_decoded_mean = decoder_mean(_h_decoded)
-    generator = keras.models.Model(decoder_input, _x_decoded_mean)
-
-    # Build and save the autoencoder
-    _h_decoded2 = decoder_h(z_mean)
-    _x_decoded_mean2 = decoder_mean(_h_decoded2)
-    autoencoder = keras.models.Model(x, _x_decoded_mean2)
-
-    if save_results:
-        # Save encoder structure and weights
-        temp = open(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'curve_encoder_structure.yml'), 'w')
-        temp.write(encoder.to_yaml())
-        temp.close()
-        encoder.save_weights(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'curve_encoder_weights.h5'))
-
-        # Save decoder structure and weights
-        temp = open(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'curve_decoder_structure.yml'), 'w')
-        temp.write(generator.to_yaml())
-        temp.close()
-        generator.save_weights(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'curve_decoder_weights.h5'))
-
-        # Save full autoencoder structure and weights
-        structure = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'curve_autoencoder_structure.yml')
-        weights = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'curve_autoencoder_weights.h5')
-        temp = open(structure, 'w')
-        temp.write(autoencoder.to_yaml())
-        temp.close()
-        autoencoder.save_weights(weights)
-
-    if print_network:
-        keras.utils.plot_model(generator, to_file=pkg_resources.resource_filename('WAnet', 'figures/'+str(latent_dim)+'curve_decoder.eps'), show_shapes=True)
-        keras.utils.plot_model(encoder, to_file=pkg_resources.resource_filename('WAnet', 'figures/'+str(latent_dim)+'curve_encoder.eps'), show_shapes=True)
-        keras.utils.plot_model(autoencoder, to_file=pkg_resources.resource_filename('WAnet', 'figures/'+str(latent_dim)+'curve_autoencoder.eps'), show_shapes=True)
-
-    x_pred = autoencoder.predict(x_test)
-    s2 = numpy.mean(numpy.power(numpy.mean(x_test.flatten()) - x_test.flatten(), 2))
-    mse = keras.backend.mean(keras.losses.mean_squared_error(x_pred, x_test)).eval()
-    r2 = 1-mse/s2
-    print("Final MSE: "+str(mse))
-    print("Final S2: "+str(s2))
-    print("Final R2: "+str(r2))
-
-    return r2
-
-
-def train_forward_network(epochs, latent_dim, save_results, print_network):
-    curves, geometry, S, N, D, F, G, new_curves, new_geometry = load_data()
+def build_forward_network(latent_dim, G, D, F, geo, curve, mask=None):
+    # geo and curve are the trained geometry encoder and curve decoder, mask the VoxelMask geo was trained with
 
-    # Define model
-    x   = keras.layers.Input(shape=(32768,))
-    de1 = keras.layers.Dense(256, activation='relu')(x)
-    de2 = keras.layers.Dense(latent_dim, activation='relu')(de1)
+    # Define model, reusing a convolutional geometry encoder whole
+    x   = keras.layers.Input(shape=(G * G * G if mask is None else mask.size,))
+    if _is_conv(geo):
+        encoder_layers = []
+        de2 = keras.layers.Activation('relu')(geo(x))
+    else:
+        encoder_layers = [keras.layers.Dense(256, activation='relu'), keras.layers.Dense(latent_dim, activation='relu')]
+        de2 = encoder_layers[1](encoder_layers[0](x))
     con = keras.layers.Dense(latent_dim, activation='relu')(de2)
-    dd2 = keras.layers.Dense(64, activation='relu')(con)
-    y   = keras.layers.Dense(192, activation='sigmoid')(dd2)
+    decoder_layers = [keras.layers.Dense(64, activation='relu'), keras.layers.Dense(D * F, activation='sigmoid')]
+    y   = decoder_layers[1](decoder_layers[0](con))
 
     # Build and compile ,model
+    _freeze(geo, encoder_layers, geo.layers[1:3])
+    _freeze(curve, decoder_layers, curve.layers[1:3])
     mdl = keras.models.Model(x, y)
     mdl.compile(optimizer='rmsprop', loss='mse')
+    return mdl, [('forward', mdl)]
+
+
+def build_inverse_network(latent_dim, G, D, F, geo, curve, mask=None):
+    # geo and curve are the trained geometry decoder and curve encoder, mask the VoxelMask geo was trained with
 
-    # # Instantiate and freeze layers if possible
-    temp = open(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'geometry_encoder_structure.yml'), 'r')
-    geo = keras.models.model_from_yaml(temp.read())
-    geo.load_weights(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'geometry_encoder_weights.h5'))
-
-    # Load curve autoencoder
-    temp = open(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'curve_decoder_structure.yml'), 'r')
-    curve = keras.models.model_from_yaml(temp.read())
-    curve.load_weights(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'curve_decoder_weights.h5'))
-
-    mdl.layers[1].set_weights(geo.layers[1].get_weights())
-    mdl.layers[1].trainable = False
-    mdl.layers[2].set_weights(geo.layers[2].get_weights())
-    mdl.layers[2].trainable = False
-
-    mdl.layers[4].set_weights(curve.layers[1].get_weights())
-    mdl.layers[4].trainable = False
-    mdl.layers[5].set_weights(curve.layers[2].get_weights())
-    mdl.layers[5].trainable = False
-
-    # Make file names
-    weights = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'forward_weights.h5')
-    structure = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'forward_structure.yml')
-    plot = pkg_resources.resource_filename('WAnet', 'figures/'+str(latent_dim)+'forward.eps')
-
-    # Save model structure and start training
-    x_train, x_test, y_train, y_test = sklearn.model_selection.train_test_split(new_geometry, new_curves, shuffle=False)
-    if save_results:
-        mdl.fit(x_train, y_train, verbose=VERBOSE, epochs=epochs, shuffle=False, validation_data=(x_test, y_test),
-                callbacks=[keras.callbacks.ModelCheckpoint(filepath=weights, verbose=VERBOSE, save_best_only=True)])
-
-        # Save decoder structure and weights
-        temp = open(structure, 'w')
-        temp.write(mdl.to_yaml())
-        temp.close()
+    # Define model, reusing a convolutional geometry decoder whole
+    x   = keras.layers.Input(shape=(D * F,))
+    encoder_layers = [keras.layers.Dense(64, activation='relu'), keras.layers.Dense(latent_dim, activation='relu')]
+    de2 = encoder_layers[1](encoder_layers[0](x))
+    con = keras.layers.Dense(latent_dim, activation='relu')(de2)
+    if _is_conv(geo):
+        decoder_layers = []
+        y   = geo(con)
     else:
-        mdl.fit(new_geometry, new_curves, verbose=VERBOSE, epochs=epochs, shuffle=False, validation_data=(x_test, y_test))
+        decoder_layers = [keras.layers.Dense(256, activation='relu'),
+                          keras.layers.Dense(G * G * G if mask is None else mask.size, activation='sigmoid')]
+        y   = decoder_layers[1](decoder_layers[0](con))
 
-    if print_network:
-        keras.utils.plot_model(mdl, to_file=plot, show_shapes=True)
+    # Build and compile ,model
+    _freeze(curve, encoder_layers, curve.layers[1:3])
+    _freeze(geo, decoder_layers, geo.layers[1:3])
+    mdl = keras.models.Model(x, y)
+    mdl.compile(optimizer='rmsprop', loss='binary_crossentropy')
+    return mdl, [('inverse', mdl)]
 
-    #
-    mdl.load_weights(weights)
-    y_pred = mdl.predict(x_test)
-    s2 = numpy.mean(numpy.power(numpy.mean(y_test.flatten()) - y_test.flatten(), 2))
-    mse = keras.backend.mean(keras.losses.mean_squared_error(y_pred, y_test)).eval()
-    r2 = 1-mse/s2
-    print("Final MSE: "+str(mse))
-    print("Final S2: "+str(s2))
-    print("Final R2: "+str(r2))
 
-    return r2
+def build_simple_inverse_network(G, D, F):
+    # Define model
+    x   = keras.layers.Input(shape=(D * F,))
+    de1 = keras.layers.Dense(384, activation='relu')(x)
+    de2 = keras.layers.Dense(768, activation='relu')(de1)
+    con = keras.layers.Dense(1536, activation='relu')(de2)
+    dd2 = keras.layers.Dense(3072, activation='relu')(con)
+    y   = keras.layers.Dense(G * G * G, activation='sigmoid')(dd2)
 
+    # Build and compile ,model
+    mdl = keras.models.Model(x, y)
+    mdl.compile(optimizer='rmsprop', loss='binary_crossentropy')
+    return mdl, [('simple_inverse', mdl)]
 
-def train_inverse_network(epochs, latent_dim, save_results, print_network):
-    curves, geometry, S, N, D, F, G, new_curves, new_geometry = load_data()
 
+def build_simple_forward_network(G, D, F):
     # Define model
-    x   = keras.layers.Input(shape=(192,))
-    de1 = keras.layers.Dense(64, activation='relu')(x)
-    de2 = keras.layers.Dense(latent_dim, activation='relu')(de1)
-    con = keras.layers.Dense(latent_dim, activation='relu')(de2)
-    dd2 = keras.layers.Dense(256, activation='relu')(con)
-    y   = keras.layers.Dense(32768, activation='sigmoid')(dd2)
+    x   = keras.layers.Input(shape=(G * G * G,))
+    de1 = keras.layers.Dense(3072, activation='relu')(x)
+    de2 = keras.layers.Dense(1536, activation='relu')(de1)
+    con = keras.layers.Dense(768, activation='relu')(de2)
+    dd2 = keras.layers.Dense(384, activation='relu')(con)
+    y   = keras.layers.Dense(D * F, activation='sigmoid')(dd2)
 
     # Build and compile ,model
     mdl = keras.models.Model(x, y)
-    mdl.compile(optimizer='rmsprop', loss='binary_crossentropy')
+    mdl.compile(optimizer='rmsprop', loss='mse')
+    return mdl, [('simple_forward', mdl)]
 
-    # # Instantiate and freeze layers if possible
-    temp = open(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'geometry_decoder_structure.yml'), 'r')
-    geo = keras.models.model_from_yaml(temp.read())
-    geo.load_weights(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'geometry_decoder_weights.h5'))
-
-    # Load curve autoencoder
-    temp = open(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'curve_encoder_structure.yml'), 'r')
-    curve = keras.models.model_from_yaml(temp.read())
-    curve.load_weights(pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'curve_encoder_weights.h5'))
-
-    mdl.layers[1].set_weights(curve.layers[1].get_weights())
-    mdl.layers[1].trainable = False
-    mdl.layers[2].set_weights(curve.layers[2].get_weights())
-    mdl.layers[2].trainable = False
-
-    mdl.layers[4].set_weights(geo.layers[1].get_weights())
-    mdl.layers[4].trainable = False
-    mdl.layers[5].set_weights(geo.layers[2].get_weights())
-    mdl.layers[5].trainable = False
-
-    # Make file names
-    weights = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'inverse_weights.h5')
-    structure = pkg_resources.resource_filename('WAnet', 'trained_models/'+str(latent_dim)+'inverse_structure.yml')
-    plot = pkg_resources.resource_filename('WAnet', 'figures/'+str(latent_dim)+'inverse.eps')
-
-    # Save model structure and start training
-    x_train, x_test, y_train, y_test = sklearn.model_selection.train_test_split(new_curves, new_geometry, shuffle=False)
-    if save_results:
-        mdl.fit(new_curves, new_geometry, verbose=VERBOSE, epochs=epochs, shuffle=False, validation_data=(x_test, y_test),
-                callbacks=[keras.callbacks.ModelCheckpoint(filepath=weights, verbose=VERBOSE, save_best_only=True)])
-        # Save decoder structure and weights
-        temp = open(structure, 'w')
-        temp.write(mdl.to_yaml())
-        temp.close()
-    else:
-        mdl.fit(new_curves, new_geometry, verbose=VERBOSE, epochs=epochs, shuffle=False, validation_data=(x_test, y_test))
 
-    if print_network:
-        keras.utils.plot_model(mdl, to_file=plot, show_shapes=True)
+def train_geometry_autoencoder(epochs, latent_dim, save_results, print_network, architecture='dense', resume=False,
+                               patience=None, time_budget=None, callbacks=None, mask=False):
+    # With mask, voxels that are empty or full in every case are left out, and the forward and inverse networks
+    # trained on top of this autoencoder follow suit
+    started = time.time()
+    curves, geometry, S, N, D, F, G, new_curves, new_geometry = load_data(packed=True)
+    mask = load_mask() if mask else None
+    if mask is not None:
+        new_geometry = WAnet.voxels.MaskedVoxels(new_geometry.packed, G, mask)
 
+    trainer = Trainer('geometry_vae', latent_dim, lambda: build_geometry_vae(latent_dim, G, architecture, mask),
+                      new_geometry, None, 'bce', batch_size=100, shuffle=True, callbacks=callbacks,
+                      load_seconds=time.time() - started, mask=mask)
+    return trainer.train(epochs, save_results, print_network, resume, patience, time_budget)
 
-    # Final check on metrics
-    mdl.load_weights(weights)
-    y_pred = mdl.predict(x_test)
-    mse = keras.backend.mean(keras.losses.binary_crossentropy(y_pred, y_test)).eval()
-    y_pred.fill(numpy.mean(x_test.flatten()))
-    s2 = keras.backend.mean(keras.losses.binary_crossentropy(y_pred, y_test)).eval()
-    r2 = 1-mse/s2
-    print("Final BCE: "+str(mse))
-    print("Final S2: "+str(s2))
-    print("Final R2: "+str(r2))
 
-    return r2
+def train_response_autoencoder(epochs, latent_dim, save_results, print_network, resume=False, patience=None,
+                               time_budget=None, callbacks=None):
+    started = time.time()
+    curves, geometry, S, N, D, F, G, new_curves, new_geometry = load_data(packed=True)
 
+    trainer = Trainer('curve_vae', latent_dim, lambda: build_response_vae(latent_dim, D, F),
+                      new_curves, None, 'mse', batch_size=10, shuffle=True, callbacks=callbacks, breakdown=(D, F),
+                      load_seconds=time.time() - started)
+    return trainer.train(epochs, save_results, print_network, resume, patience, time_budget)
 
-def train_simple_inverse_network(epochs, save_results, print_network):
-    curves, geometry, S, N, D, F, G, new_curves, new_geometry = load_data()
 
-    # Define model
-    x   = keras.layers.Input(shape=(192,))
-    de1 = keras.layers.Dense(384, activation='relu')(x)
-    de2 = keras.layers.Dense(768, activation='relu')(de1)
-    con = keras.layers.Dense(1536, activation='relu')(de2)
-    dd2 = keras.layers.Dense(3072, activation='relu')(con)
-    y   = keras.layers.Dense(32768, activation='sigmoid')(dd2)
+def train_forward_network(epochs, latent_dim, save_results, print_network, resume=False, patience=None,
+                          time_budget=None, callbacks=None):
+    started = time.time()
+    curves, geometry, S, N, D, F, G, new_curves, new_geometry = load_data(packed=True)
 
-    # Build and compile ,model
-    mdl = keras.models.Model(x, y)
-    mdl.compile(optimizer='rmsprop', loss='binary_crossentropy')
+    mask = _load_saved_mask(str(latent_dim)+'geometry_encoder')
+    if mask is not None:
+        new_geometry = WAnet.voxels.MaskedVoxels(new_geometry.packed, G, mask)
 
-    # Make file names
-    weights = pkg_resources.resource_filename('WAnet', 'trained_models/simple_inverse_weights.h5')
-    structure = pkg_resources.resource_filename('WAnet', 'trained_models/simple_inverse_structure.yml')
-    plot = pkg_resources.resource_filename('WAnet', 'figures/simple_inverse.eps')
-
-    # Save model structure and start training
-    x_train, x_test, y_train, y_test = sklearn.model_selection.train_test_split(new_curves, new_geometry, shuffle=False)
-    if save_results:
-        mdl.fit(new_curves, new_geometry, verbose=VERBOSE, epochs=epochs, shuffle=False, validation_data=(x_test, y_test),
-                callbacks=[keras.callbacks.ModelCheckpoint(filepath=weights, verbose=VERBOSE, save_best_only=True)])
-        # Save decoder structure and weights
-        temp = open(structure, 'w')
-        temp.write(mdl.to_yaml())
-        temp.close()
-    else:
-        mdl.fit(new_curves, new_geometry, verbose=VERBOSE, epochs=epochs, shuffle=False, validation_data=(x_test, y_test))
+    # Instantiate and freeze layers if possible
+    def build():
+        return build_forward_network(latent_dim, G, D, F, _load_saved(str(latent_dim)+'geometry_encoder'),
+                                     _load_saved(str(latent_dim)+'curve_decoder'), mask)
 
-    if print_network:
-        keras.utils.plot_model(mdl, to_file=plot, show_shapes=True)
+    trainer = Trainer('forward', latent_dim, build, new_geometry, new_curves, 'mse', callbacks=callbacks,
+                      breakdown=(D, F), load_seconds=time.time() - started, mask=mask)
+    return trainer.train(epochs, save_results, print_network, resume, patience, time_budget)
 
 
-    # Final check on metrics
-    mdl.load_weights(weights)
-    y_pred = mdl.predict(x_test)
-    mse = keras.backend.mean(keras.losses.binary_crossentropy(y_pred, y_test)).eval()
-    y_pred.fill(numpy.mean(x_test.flatten()))
-    s2 = keras.backend.mean(keras.losses.binary_crossentropy(y_pred, y_test)).eval()
-    r2 = 1-mse/s2
-    print("Final BCE: "+str(mse))
-    print("Final S2: "+str(s2))
-    print("Final R2: "+str(r2))
+def train_inverse_network(epochs, latent_dim, save_results, print_network, resume=False, patience=None,
+                          time_budget=None, callbacks=None):
+    started = time.time()
+    curves, geometry, S, N, D, F, G, new_curves, new_geometry = load_data(packed=True)
 
-    return r2
+    mask = _load_saved_mask(str(latent_dim)+'geometry_decoder')
+    if mask is not None:
+        new_geometry = WAnet.voxels.MaskedVoxels(new_geometry.packed, G, mask)
 
+    # Instantiate and freeze layers if possible
+    def build():
+        return build_inverse_network(latent_dim, G, D, F, _load_saved(str(latent_dim)+'geometry_decoder'),
+                                     _load_saved(str(latent_dim)+'curve_encoder'), mask)
 
-def train_simple_forward_network(epochs, save_results, print_network):
+    trainer = Trainer('inverse', latent_dim, build, new_curves, new_geometry, 'bce', callbacks=callbacks,
+                      load_seconds=time.time() - started, mask=mask)
+    return trainer.train(epochs, save_results, print_network, resume, patience, time_budget)
 
-    curves, geometry, S, N, D, F, G, new_curves, new_geometry = load_data()
 
-    # Define model
-    x   = keras.layers.Input(shape=(32768,))
-    de1 = keras.layers.Dense(3072, activation='relu')(x)
-    de2 = keras.layers.Dense(1536, activation='relu')(de1)
-    con = keras.layers.Dense(768, activation='relu')(de2)
-    dd2 = keras.layers.Dense(384, activation='relu')(con)
-    y   = keras.layers.Dense(192, activation='sigmoid')(dd2)
+def train_simple_inverse_network(epochs, save_results, print_network, resume=False, patience=None, time_budget=None,
+                                 callbacks=None):
+    started = time.time()
+    curves, geometry, S, N, D, F, G, new_curves, new_geometry = load_data(packed=True)
 
+    trainer = Trainer('simple_inverse', '', lambda: build_simple_inverse_network(G, D, F), new_curves, new_geometry,
+                      'bce', callbacks=callbacks, load_seconds=time.time() - started)
+    return trainer.train(epochs, save_results, print_network, resume, patience, time_budget)
 
-    # Build and compile ,model
-    mdl = keras.models.Model(x, y)
-    mdl.compile(optimizer='rmsprop', loss='mse')
 
-    # Make file names
-    weights = pkg_resources.resource_filename('WAnet', 'trained_models/simple_forward_weights.h5')
-    structure = pkg_resources.resource_filename('WAnet', 'trained_models/simple_forward_structure.yml')
-    plot = pkg_resources.resource_filename('WAnet', 'figures/simple_forward.eps')
-
-    # Save model structure and start training
-    x_train, x_test, y_train, y_test = sklearn.model_selection.train_test_split(new_geometry, new_curves, shuffle=False)
-    if save_results:
-        mdl.fit(x_train, y_train, verbose=VERBOSE, epochs=epochs, shuffle=False, validation_data=(x_test, y_test),
-                callbacks=[keras.callbacks.ModelCheckpoint(filepath=weights, verbose=VERBOSE, save_best_only=True)])
-
-        # Save decoder structure and weights
-        temp = open(structure, 'w')
-        temp.write(mdl.to_yaml())
-        temp.close()
-    else:
-        mdl.fit(new_geometry, new_curves, verbose=VERBOSE, epochs=epochs, shuffle=False, validation_data=(x_test, y_test))
-
-    if print_network:
-        keras.utils.plot_model(mdl, to_file=plot, show_shapes=True)
-
-    #
-    mdl.load_weights(weights)
-    y_pred = mdl.predict(x_test)
-    s2 = numpy.mean(numpy.power(numpy.mean(y_test.flatten()) - y_test.flatten(), 2))
-    mse = keras.backend.mean(keras.losses.mean_squared_error(y_pred, y_test)).eval()
-    r2 = 1 - mse / s2
-    print("Final MSE: " + str(mse))
-    print("Final S2: " + str(s2))
-    print("Final R2: " + str(r2))
-
-    return r2
\ No newline at end of file
+def train_simple_forward_network(epochs, save_results, print_network, resume=False, patience=None, time_budget=None,
+                                 callbacks=None):
+    started = time.time()
+    curves, geometry, S, N, D, F, G, new_curves, new_geometry = load_data(packed=True)
+
+    trainer = Trainer('simple_forward', '', lambda: build_simple_forward_network(G, D, F), new_geometry, new_curves,
+                      'mse', callbacks=callbacks, breakdown=(D, F), load_seconds=time.time() - started)
+    return trainer.train(epochs, save_results, print_network, resume, patience, time_budget)
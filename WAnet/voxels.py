@@ -0,0 +1,197 @@
+import numpy
+
+
+def pack(voxels):
+    # One bit per voxel, row by row
+    return numpy.packbits(numpy.atleast_2d(voxels) > 0.5, axis=1)
+
+
+def unpack(packed, count, dtype=float):
+    return numpy.unpackbits(packed, axis=1, count=count).astype(dtype)
+
+
+class PackedVoxels(object):
+
+    def __init__(self, packed, G):
+        # Rows are flattened G x G x G grids in the same order as new_geometry
+        self.packed = packed
+        self.G = G
+        self.count = G * G * G
+
+    @classmethod
+    def from_dense(cls, voxels, G):
+        return cls(pack(voxels), G)
+
+    @property
+    def shape(self):
+        return len(self.packed), self.count
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __getitem__(self, key):
+        # Row selection stays packed, so that splits and batches are cheap. Columns are bits inside bytes, so they
+        # can only be taken whole, as [rows, :] or the [rows, ...] sklearn uses.
+        if isinstance(key, tuple):
+            whole = len(key) < 2 or key[1] is Ellipsis or (isinstance(key[1], slice) and key[1] == slice(None))
+            if len(key) > 2 or not whole:
+                raise IndexError("PackedVoxels only selects rows, unpack it to select voxels")
+            key = key[0]
+        if isinstance(key, (int, numpy.integer)):
+            key = slice(key, key + 1 if key != -1 else None)
+        return PackedVoxels(self.packed[key], self.G)
+
+    def take(self, indices, axis=0):
+        return PackedVoxels(numpy.take(self.packed, indices, axis=axis), self.G)
+
+    def unpack(self, dtype=float):
+        return unpack(self.packed, self.count, dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.unpack(dtype if dtype is not None else float)
+
+    def batches(self, batch_size, dtype=float):
+        for i in range(0, len(self), batch_size):
+            yield unpack(self.packed[i:(i + batch_size)], self.count, dtype)
+
+    def save(self, filename):
+        numpy.savez(filename, packed=self.packed, G=self.G)
+
+
+def batches(voxels, batch_size, dtype=float):
+    # Dense batches from either a dense array or PackedVoxels
+    if isinstance(voxels, PackedVoxels):
+        return voxels.batches(batch_size, dtype)
+    return (voxels[i:(i + batch_size)] for i in range(0, len(voxels), batch_size))
+
+
+def load(filename):
+    data = numpy.load(filename)
+    return PackedVoxels(data['packed'], int(data['G']))
+
+
+class VoxelMask(object):
+
+    def __init__(self, active, fill, G):
+        # active marks the voxels that differ between cases, fill is the value all cases share everywhere else
+        self.active = numpy.asarray(active, dtype=bool).ravel()
+        self.fill = numpy.asarray(fill, dtype=bool).ravel() & ~self.active
+        self.G = G
+        self.count = G * G * G
+        self.size = int(numpy.sum(self.active))
+
+    @classmethod
+    def from_data(cls, voxels, G, batch_size=1000):
+        # Occupancy of every voxel over the data set, a batch at a time
+        occupied = numpy.zeros(G * G * G, dtype=numpy.int64)
+        for batch in batches(voxels, batch_size, numpy.uint8):
+            occupied += numpy.sum(numpy.asarray(batch) > 0.5, axis=0)
+
+        return cls((occupied > 0) & (occupied < len(voxels)), occupied == len(voxels), G)
+
+    def compress(self, voxels, dtype=float):
+        # Only the active columns of full grids
+        if isinstance(voxels, PackedVoxels):
+            voxels = voxels.unpack(dtype)
+        return numpy.asarray(voxels, dtype=dtype)[:, self.active]
+
+    def expand(self, data):
+        # Full grids, with the inactive voxels set to the value they have in every case
+        data = numpy.atleast_2d(data)
+        voxels = numpy.empty((len(data), self.count), dtype=data.dtype)
+        voxels[:] = self.fill
+        voxels[:, self.active] = data
+        return voxels
+
+    def save(self, filename):
+        numpy.savez(filename, active=pack(self.active), fill=pack(self.fill), G=self.G)
+
+
+def load_mask(filename):
+    data = numpy.load(filename)
+    G = int(data['G'])
+    return VoxelMask(unpack(data['active'], G * G * G, bool), unpack(data['fill'], G * G * G, bool), G)
+
+
+class MaskedVoxels(PackedVoxels):
+
+    def __init__(self, packed, G, mask):
+        # Packed full grids that unpack to the active voxels of mask only
+        super(MaskedVoxels, self).__init__(packed, G)
+        self.mask = mask
+
+    @property
+    def shape(self):
+        return len(self.packed), self.mask.size
+
+    def __getitem__(self, key):
+        return MaskedVoxels(super(MaskedVoxels, self).__getitem__(key).packed, self.G, self.mask)
+
+    def take(self, indices, axis=0):
+        return MaskedVoxels(numpy.take(self.packed, indices, axis=axis), self.G, self.mask)
+
+    def unpack(self, dtype=float):
+        return unpack(self.packed, self.count, dtype)[:, self.mask.active]
+
+    def batches(self, batch_size, dtype=float):
+        for batch in super(MaskedVoxels, self).batches(batch_size, dtype):
+            yield batch[:, self.mask.active]
+
+
+class MaskedModel(object):
+
+    def __init__(self, model, mask):
+        # A model trained on the active voxels of mask, used as if it took and gave full grids
+        self.model = model
+        self.mask = mask
+        self.masked_input = model.input_shape[1] == mask.size
+        self.masked_output = model.output_shape[1] == mask.size
+
+    @property
+    def input_shape(self):
+        return (None, self.mask.count) if self.masked_input else self.model.input_shape
+
+    @property
+    def output_shape(self):
+        return (None, self.mask.count) if self.masked_output else self.model.output_shape
+
+    def predict(self, x, batch_size=32):
+        if self.masked_input:
+            x = self.mask.compress(x, getattr(x, 'dtype', numpy.float32))
+        y = self.model.predict(x, batch_size=batch_size)
+        return self.mask.expand(y) if self.masked_output else y
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+# Corners of the unit square on each side of a cell, for every (axis, side) pair
+_FACE_SQUARE = numpy.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+
+
+def exposed_faces(matrix, threshold=0.5):
+    # Faces of the filled cells of a 3D array that do not touch another filled cell, as (n, 4, 3) quad corners
+    # in index units, cell (i, j, k) spanning [i, i + 1] x [j, j + 1] x [k, k + 1], and (n, 3) outward normals
+    filled = numpy.pad(numpy.asarray(matrix) > threshold, 1)
+    corners = []
+    normals = []
+    for axis in range(3):
+        others = [a for a in range(3) if a != axis]
+        for side in (-1, 1):
+            exposed = filled & ~numpy.roll(filled, -side, axis=axis)
+            cells = numpy.argwhere(exposed[1:-1, 1:-1, 1:-1])
+
+            square = numpy.zeros((4, 3), dtype=int)
+            square[:, others] = _FACE_SQUARE
+            square[:, axis] = side > 0
+            corners.append(cells[:, None, :] + square[None, :, :])
+
+            normal = numpy.zeros((len(cells), 3), dtype=int)
+            normal[:, axis] = side
+            normals.append(normal)
+
+    return numpy.concatenate(corners), numpy.concatenate(normals)
@@ -7,6 +7,7 @@ QUICK = False
 
 # Set variables
 latent_dims = [2, 4, 8, 16, 32]
+patience = 10
 example_size = (2, 3)
 
 # Preprocess to extract the data
@@ -21,16 +22,15 @@ r2_r = []
 
 if TRAIN:
     for latent_dim in latent_dims:
-        r2_r.append(WAnet.training.train_response_autoencoder(100, latent_dim, True, True))
-        r2_g.append(WAnet.training.train_geometry_autoencoder(40, latent_dim, True, True))
-        r2_f.append(WAnet.training.train_forward_network(25, latent_dim, True, True))
-        r2_i.append(WAnet.training.train_inverse_network(25, latent_dim, True, True))
+        # Epoch counts are upper bounds, each run stops once validation loss stops improving
+        r2_r.append(WAnet.training.train_response_autoencoder(100, latent_dim, True, True, patience=patience))
+        r2_g.append(WAnet.training.train_geometry_autoencoder(40, latent_dim, True, True, patience=patience))
+        r2_f.append(WAnet.training.train_forward_network(25, latent_dim, True, True, patience=patience))
+        r2_i.append(WAnet.training.train_inverse_network(25, latent_dim, True, True, patience=patience))
 
 print(r2_r, r2_g, r2_f, r2_i)
 
 if EXAMPLES:
-    WAnet.showing.plot_examples("geometry_autoencoder", example_size[0], example_size[1], quick=QUICK)
-    WAnet.showing.plot_examples("curve_autoencoder", example_size[0], example_size[1], quick=QUICK)
-    WAnet.showing.plot_examples("forward", example_size[0], example_size[1], quick=QUICK)
-    WAnet.showing.plot_examples("inverse", example_size[0], example_size[1], quick=QUICK)
+    # Every model at every latent size, in parallel, skipping figures that are already up to date
+    WAnet.reporting.build_report(latent_dims=latent_dims, nx=example_size[0], ny=example_size[1], quick=QUICK)
     WAnet.showing.plot_BIEM_example()
@@ -0,0 +1,43 @@
+import unittest
+import numpy
+import os
+import subprocess
+import sys
+import tempfile
+import WAnet.benchmarking
+import WAnet.preprocessing
+
+
+class Test(unittest.TestCase):
+
+    def test_synthetic_cases(self):
+        directory = tempfile.mkdtemp()
+        case_dirs = WAnet.benchmarking.write_cases(os.path.join(directory, 'NEMOH_data'), 5)
+        for case_dir in case_dirs:
+            with self.subTest(case_dir=case_dir):
+                self.assertEqual(WAnet.preprocessing.read_excitation_force(case_dir).shape, (64, 3))
+                self.assertEqual(numpy.sum(WAnet.preprocessing.voxelize_vertices(
+                    WAnet.preprocessing.read_vertices(case_dir), 16)) > 0, True)
+
+    def test_run(self):
+        results = WAnet.benchmarking.run(('parsing', 'openwec'), cases=5, G=16, rounds=2)
+        with self.subTest():
+            self.assertEqual(len(results['benchmarks']), 7)
+            self.assertEqual(all(benchmark['stats']['rounds'] == 2 for benchmark in results['benchmarks']), True)
+        with self.subTest():
+            self.assertEqual(len(WAnet.benchmarking.compare(results, results)), 0)
+            baseline = {'benchmarks': [dict(benchmark, stats={'mean': benchmark['stats']['mean'] / 10})
+                                       for benchmark in results['benchmarks']]}
+            self.assertEqual(len(WAnet.benchmarking.compare(results, baseline)), 7)
+
+    def test_imports(self):
+        # Meshing and voxel work must not pull in keras, matplotlib, scipy or sklearn
+        script = ('import sys, WAnet, WAnet.openwec, WAnet.preprocessing; WAnet.voxels.pack; '
+                  'print(",".join(m for m in ("keras", "theano", "matplotlib", "scipy", "sklearn") if m in sys.modules))')
+        loaded = subprocess.check_output([sys.executable, '-c', script], universal_newlines=True).strip()
+        with self.subTest():
+            self.assertEqual(loaded, '')
+        name, function = WAnet.benchmarking._imports({})[0]
+        with self.subTest():
+            self.assertEqual(name, 'import[WAnet]')
+            self.assertEqual(WAnet.benchmarking.measure(function, 2)['rounds'], 2)
@@ -0,0 +1,69 @@
+import unittest
+import numpy
+import WAnet.evaluating
+import WAnet.openwec
+
+
+class Forward(object):
+    # Predicts the filled fraction of the grid, plus an offset that differs between members of the ensemble
+    input_shape = (None, 512)
+
+    def __init__(self, offset):
+        self.offset = offset
+
+    def predict(self, geometry, batch_size=32):
+        return numpy.mean(geometry, axis=1)[:, None] + self.offset * numpy.ones((1, 6))
+
+
+class Autoencoder(object):
+    # Reconstructs every voxel as a quarter
+    def predict(self, geometry, batch_size=32):
+        return 0.25 * numpy.ones_like(geometry)
+
+
+class Test(unittest.TestCase):
+
+    def test_score(self):
+        evaluator = WAnet.evaluating.HybridEvaluator(forward=[Forward(0), Forward(0.1), Forward(0.5)],
+                                                     autoencoder=Autoencoder())
+        geometry = numpy.zeros((3, 512))
+        geometry[1, :128] = 1
+        geometry[2] = 1
+        curves, spread, reconstruction = evaluator.score(geometry, batch_size=2)
+        with self.subTest():
+            numpy.testing.assert_allclose(curves, numpy.mean(geometry, axis=1)[:, None] + 0.2 * numpy.ones((1, 6)))
+            numpy.testing.assert_allclose(spread, numpy.std([0, 0.1, 0.5]) * numpy.ones(3))
+        with self.subTest():
+            # Binary cross-entropy of the reconstruction against the input
+            filled = numpy.mean(geometry, axis=1)
+            numpy.testing.assert_allclose(reconstruction, -(filled * numpy.log(0.25) + (1 - filled) * numpy.log(0.75)))
+        with self.subTest():
+            evaluator.autoencoder = None
+            self.assertEqual(numpy.all(evaluator.score(geometry)[2] == 0), True)
+
+    def test_uncertain(self):
+        spread = numpy.array([0.0, 0.2, 0.0, 0.2])
+        reconstruction = numpy.array([0.0, 0.0, 0.8, 0.8])
+        for spread_tolerance, reconstruction_tolerance, flags in ((0.1, None, [0, 1, 0, 1]), (None, 0.5, [0, 0, 1, 1]),
+                                                                  (0.1, 0.5, [0, 1, 1, 1]), (None, None, [0, 0, 0, 0])):
+            evaluator = WAnet.evaluating.HybridEvaluator(forward=[Forward(0)], spread_tolerance=spread_tolerance,
+                                                         reconstruction_tolerance=reconstruction_tolerance)
+            with self.subTest(spread_tolerance=spread_tolerance, reconstruction_tolerance=reconstruction_tolerance):
+                self.assertEqual(evaluator.uncertain(spread, reconstruction).tolist(), [bool(flag) for flag in flags])
+
+    def test_evaluate(self):
+        # Without solving, shapes and meshes alike are scored by the surrogates only
+        evaluator = WAnet.evaluating.HybridEvaluator(forward=[Forward(0), Forward(0.5)], spread_tolerance=0.1)
+        candidates = [('box', [4, 5, 3]), WAnet.openwec.box(6, 6, 6, [0, 0, 0])]
+        curves, spread, reconstruction, flags, case_dirs = evaluator.evaluate(candidates, solve=False)
+        with self.subTest():
+            self.assertEqual(curves.shape, (2, 6))
+            self.assertEqual(flags.tolist(), [True, True])
+            self.assertEqual(case_dirs, [None, None])
+        with self.subTest():
+            self.assertEqual(evaluator.G, 8)
+            self.assertLess(curves[0, 0], curves[1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import numpy
+import os
+import tempfile
+import WAnet.fitting
+import WAnet.preprocessing
+import WAnet.voxels
+
+
+class Test(unittest.TestCase):
+
+    def test_similarity(self):
+        voxels = numpy.array([[1, 1, 0, 0], [0, 0, 0, 0]])
+        signatures = numpy.array([[1, 1, 0, 0], [1, 0, 1, 0], [0, 0, 0, 0]])
+        with self.subTest():
+            numpy.testing.assert_allclose(WAnet.fitting.similarity(voxels, signatures),
+                                          [[1, 1.0 / 3, 0], [0, 0, 0]])
+            numpy.testing.assert_allclose(WAnet.fitting.similarity(voxels, signatures, 'hamming', batch_size=2),
+                                          [[0, -2, -2], [-2, -2, 0]])
+
+    def test_fit(self):
+        # Shapes between lattice points are matched to their family and refinement only improves the fit. A lattice
+        # this coarse ranks the sphere below a cone, so every family is refined.
+        fitter = WAnet.fitting.ShapeFitter(steps=4, G=16, directory=tempfile.mkdtemp())
+        shapes = [('box', [4.1, 8.3, 5.2]), ('sphere', [6.6]), ('cylinder', [8.1, 4.4])]
+        geometry = WAnet.preprocessing.voxelize_batch(shapes, 16, packed=True)
+        indices, scores = fitter.match(geometry, top=3)
+        fits = fitter.fit(geometry, iterations=10, families=len(WAnet.preprocessing.GEOMETRIES))
+        for (shape, dimensions), fit, score in zip(shapes, fits, scores[:, 0]):
+            with self.subTest(shape=shape):
+                self.assertEqual(fit[0], shape)
+                self.assertGreaterEqual(fit[2], score)
+                self.assertGreater(fit[2], 0.8)
+        with self.subTest():
+            self.assertEqual(indices.shape, (3, 3))
+            self.assertEqual(numpy.all(numpy.diff(scores, axis=1) <= 0), True)
+        with self.subTest():
+            # By default only the family ranked first is refined
+            fits = fitter.fit(geometry[:1], iterations=10)
+            self.assertEqual(fits[0][0], 'box')
+            self.assertGreaterEqual(fits[0][2], scores[0, 0])
+
+    def test_refine(self):
+        # Steps shrink to a fraction of a voxel and the search never leaves the limits of generate_data
+        voxels = WAnet.preprocessing.voxelize_shape('cylinder', [8.1, 4.4], 16) > 0.5
+        limits = list(WAnet.preprocessing.GEOMETRIES['cylinder']["vars"].values())
+        start = [limits[0][1], limits[1][0]]
+        start_score = WAnet.fitting.similarity(voxels[None, :],
+                                               WAnet.preprocessing.voxelize_shape('cylinder', start, 16)[None, :])[0, 0]
+        dimensions, score = WAnet.fitting.refine(voxels, 'cylinder', start, 16, iterations=30)
+        with self.subTest():
+            self.assertGreater(score, start_score)
+            self.assertGreater(score, 0.9)
+            self.assertEqual(all(low <= value <= high for value, (low, high) in zip(dimensions, limits)), True)
+
+    def test_load_lattice(self):
+        # The cache is named after the lattice it holds, and a file that no longer matches it is voxelized again
+        directory = tempfile.mkdtemp()
+        candidates, signatures = WAnet.fitting.load_lattice(2, 8, directory)
+        filename = os.path.join(directory, os.listdir(directory)[0])
+        with self.subTest():
+            key = WAnet.fitting.lattice_key(candidates, 8)
+            self.assertEqual(os.listdir(directory), ['shape_lattice_2_8_'+key+'.npz'])
+            self.assertEqual(len(signatures), len(candidates))
+        WAnet.voxels.PackedVoxels(signatures.packed[:-1], 8).save(filename)
+        with self.subTest():
+            self.assertEqual(len(WAnet.fitting.load_lattice(2, 8, directory)[1]), len(candidates))
+        WAnet.voxels.PackedVoxels(numpy.zeros_like(signatures.packed), 8).save(filename)
+        with self.subTest():
+            rebuilt = WAnet.fitting.load_lattice(2, 8, directory)[1]
+            self.assertEqual(numpy.all(rebuilt.packed == signatures.packed), True)
+        with self.subTest():
+            self.assertNotEqual(WAnet.fitting.lattice_key(candidates, 8), WAnet.fitting.lattice_key(candidates[1:], 8))
+            self.assertNotEqual(WAnet.fitting.lattice_key(candidates, 8), WAnet.fitting.lattice_key(candidates, 16))
+
+
+if __name__ == '__main__':
+    unittest.main()
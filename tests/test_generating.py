@@ -0,0 +1,43 @@
+import unittest
+import numpy
+import WAnet.generating
+
+
+class Decoder(object):
+    # Fills the voxels whose index is below the first latent value times the grid size
+    output_shape = (None, 64)
+
+    def predict(self, latents, batch_size=32):
+        return (numpy.arange(64)[None, :] < latents[:, :1] * 64).astype(numpy.float32)
+
+
+class Test(unittest.TestCase):
+
+    def test_latents(self):
+        batches = list(WAnet.generating.prior_latents(25, 3, batch_size=10))
+        with self.subTest():
+            self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        grid = numpy.vstack(list(WAnet.generating.grid_latents(2, steps=3, limits=(-1, 1), batch_size=4)))
+        with self.subTest():
+            self.assertEqual(grid.shape, (9, 2))
+            self.assertEqual(len(numpy.unique(grid, axis=0)), 9)
+        path = numpy.vstack(list(WAnet.generating.interpolation_latents([[0, 0], [1, 1]], [[1, 0], [3, 3]], steps=5)))
+        with self.subTest():
+            self.assertEqual(path.shape, (10, 2))
+            self.assertEqual(numpy.all(path[[0, 4, 5, 9]] == [[0, 0], [1, 0], [1, 1], [3, 3]]), True)
+
+    def test_decode(self):
+        latents = [numpy.array([[0.25], [0.5]]), numpy.array([[1.0]])]
+        voxels = list(WAnet.generating.decode(iter(latents), Decoder()))
+        with self.subTest():
+            self.assertEqual([batch[1].shape for batch in voxels], [(2, 64), (1, 64)])
+            self.assertEqual(voxels[1][1].G, 4)
+        with self.subTest():
+            self.assertEqual(numpy.sum(voxels[0][1].unpack(), axis=1).tolist(), [16, 32])
+        dense = list(WAnet.generating.decode(iter(latents), Decoder(), packed=False))
+        with self.subTest():
+            self.assertEqual(dense[1][1].dtype, bool)
+
+
+if __name__ == '__main__':
+    unittest.main()
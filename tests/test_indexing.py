@@ -0,0 +1,67 @@
+import unittest
+import numpy
+import tempfile
+import WAnet.indexing
+
+
+class Encoder(object):
+    # A fixed random projection standing in for a trained encoder
+    def __init__(self, inputs, latent_dim, seed):
+        self.kernel = numpy.random.RandomState(seed).standard_normal((inputs, latent_dim))
+
+    def predict(self, x, batch_size=32):
+        return numpy.dot(numpy.asarray(x, dtype=float), self.kernel)
+
+
+class Test(unittest.TestCase):
+
+    def test_query(self):
+        # The tree plus the brute-forced pending cases find the same neighbours as brute force over everything
+        random = numpy.random.RandomState(0)
+        geometry = (random.random_sample((80, 64)) > 0.5).astype(float)
+        curves = random.random_sample((80, 12))
+        names = numpy.array(['case'+str(i) for i in range(80)])
+        queries = (random.random_sample((7, 64)) > 0.5).astype(float)
+
+        def new_index(directory):
+            index = WAnet.indexing.LatentIndex(3, leaf_size=4, rebuild_fraction=0.2, directory=directory)
+            index.geometry_encoder = Encoder(64, 3, 1)
+            index.curve_encoder = Encoder(12, 3, 2)
+            return index
+
+        def check(index, number):
+            for query, encoder, corpus, inputs in ((index.query_geometry, index.geometry_encoder, geometry, queries),
+                                                   (index.query_curves, index.curve_encoder, curves, curves[70:77])):
+                found, distances, found_curves = query(inputs, 6)
+                latents = encoder.predict(corpus[:number])
+                brute = numpy.sqrt(numpy.sum(numpy.power(encoder.predict(inputs)[:, None, :] - latents[None, :, :], 2),
+                                             axis=2))
+                order = numpy.argsort(brute, axis=1)[:, :6]
+                self.assertEqual(numpy.all(found == names[order]), True)
+                numpy.testing.assert_allclose(distances, numpy.take_along_axis(brute, order, axis=1))
+                numpy.testing.assert_allclose(found_curves, curves[order])
+
+        directory = tempfile.mkdtemp()
+        index = new_index(directory)
+        index.add(names[:50], geometry[:50], curves[:50])
+        with self.subTest(stage='built'):
+            self.assertEqual(index.indexed, 50)
+            check(index, 50)
+        index.add(names[50:58], geometry[50:58], curves[50:58])
+        with self.subTest(stage='pending'):
+            self.assertEqual(index.indexed, 50)
+            check(index, 58)
+        index.add(names[58:70], geometry[58:70], curves[58:70])
+        with self.subTest(stage='rebuilt'):
+            self.assertEqual(index.indexed, 70)
+            check(index, 70)
+        index.save()
+        loaded = new_index(directory)
+        loaded.load()
+        with self.subTest(stage='loaded'):
+            self.assertEqual(loaded.indexed, 70)
+            check(loaded, 70)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import h5py
+import numpy
+import pkg_resources
+import subprocess
+import sys
+import WAnet.inference
+
+
+class Test(unittest.TestCase):
+
+    def test_curve_autoencoder(self):
+        # The autoencoder is the encoder followed by the decoder, both loaded from their own files
+        x = numpy.random.random((50, 192)).astype(numpy.float32)
+        for latent_dim in (2, 4, 16, 32):
+            autoencoder = WAnet.inference.load_model(str(latent_dim)+'curve_autoencoder')
+            encoder = WAnet.inference.load_model(str(latent_dim)+'curve_encoder')
+            decoder = WAnet.inference.load_model(str(latent_dim)+'curve_decoder')
+            with self.subTest(latent_dim=latent_dim):
+                self.assertEqual(autoencoder.input_shape, (None, 192))
+                self.assertEqual(encoder.output_shape, (None, latent_dim))
+                numpy.testing.assert_allclose(autoencoder.predict(x, batch_size=16),
+                                              decoder.predict(encoder.predict(x)), rtol=1e-5, atol=1e-6)
+
+    def test_matmuls(self):
+        # Against the weights applied by hand
+        x = numpy.random.random((10, 192)).astype(numpy.float32)
+        with h5py.File(pkg_resources.resource_filename('WAnet', 'trained_models/2curve_encoder_weights.h5'), 'r') as f:
+            kernel = f['dense_1']['dense_1/kernel'][()]
+            bias = f['dense_1']['dense_1/bias'][()]
+        hidden = numpy.maximum(numpy.dot(x, kernel) + bias, 0)
+        network = WAnet.inference.load_model('2curve_encoder')
+        network.output = network.steps[0][0]
+        with self.subTest():
+            numpy.testing.assert_allclose(network.predict(x), hidden, rtol=1e-5, atol=1e-6)
+
+    def test_without_keras(self):
+        # A fresh interpreter loads the runtime and a model without pulling in keras or theano
+        code = ("import sys, WAnet.inference; WAnet.inference.load_model('2curve_encoder'); "
+                "print(sorted(set(['keras', 'theano']) & set(sys.modules)))")
+        output = subprocess.check_output([sys.executable, '-c', code], universal_newlines=True)
+        with self.subTest():
+            self.assertEqual(output.strip(), '[]')
+
+    def test_keras(self):
+        # Same outputs as the keras models
+        import WAnet.application
+        x = numpy.random.random((20, 192)).astype(numpy.float32)
+        for case in ('2curve_autoencoder', '16curve_encoder', '32curve_decoder'):
+            keras_model = WAnet.application.load_model(case)
+            network = WAnet.inference.load_model(case)
+            inputs = x[:, :network.input_shape[1]]
+            with self.subTest(case=case):
+                numpy.testing.assert_allclose(network.predict(inputs), keras_model.predict(inputs), rtol=1e-4,
+                                              atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
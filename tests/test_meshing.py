@@ -0,0 +1,100 @@
+import unittest
+import numpy
+import os
+import tempfile
+import WAnet.meshing
+import WAnet.openwec
+import WAnet.preprocessing
+
+
+class Test(unittest.TestCase):
+
+    def test_box(self):
+        # A submerged block of cells merges into its six sides, wound outwards, enclosing its volume
+        grid = numpy.zeros((32, 32, 32), dtype=bool)
+        grid[4:10, 8:20, 2:12] = True
+        quads = WAnet.meshing.panels(grid)
+        normals = numpy.cross(quads[:, 1] - quads[:, 0], quads[:, 3] - quads[:, 0])
+        centres = numpy.mean(quads, axis=1)
+        with self.subTest():
+            self.assertEqual(len(quads), 6)
+            self.assertEqual(numpy.all(numpy.sum(normals * (centres - numpy.mean(centres, axis=0)), axis=1) > 0), True)
+        with self.subTest():
+            self.assertAlmostEqual(numpy.sum(normals[:, 2] * centres[:, 2]), 6 * 12 * 10 * (10.0 / 32) ** 3)
+
+    def test_waterline(self):
+        # A voxelized body through the free surface is extended up to z = 0 and has no lid there
+        voxels = WAnet.preprocessing.voxelize_shape('box', [6, 6, 6], 32)
+        msh = WAnet.meshing.voxels_to_mesh(voxels)
+        quads = WAnet.meshing.panels(WAnet.meshing.as_grid(voxels))
+        normals = numpy.cross(quads[:, 1] - quads[:, 0], quads[:, 3] - quads[:, 0])
+        with self.subTest():
+            self.assertEqual(msh.nf, 5)
+            self.assertAlmostEqual(numpy.max(msh.Z), 0)
+            self.assertEqual(numpy.all(normals[:, 2] <= 0), True)
+        with self.subTest():
+            # The wetted volume, from the divergence theorem as the open side is on z = 0, is that of the submerged half
+            self.assertAlmostEqual(numpy.sum(normals[:, 2] * numpy.mean(quads[:, :, 2], axis=1)) / 108, 1, delta=0.1)
+        with self.subTest():
+            filename = os.path.join(tempfile.mkdtemp(), 'mesh')
+            WAnet.openwec.writeMesh(msh, filename)
+            with open(filename) as file:
+                self.assertEqual(len(file.readlines()), 2 + msh.np + msh.nf)
+        with self.subTest():
+            # A body well below the free surface stays closed
+            voxels = WAnet.preprocessing.voxelize_mesh(WAnet.openwec.box(4, 4, 2, [0, 0, -5]))
+            msh = WAnet.meshing.voxels_to_mesh(voxels)
+            self.assertEqual(msh.nf, 6)
+            self.assertLess(numpy.max(msh.Z), -3)
+
+    def test_shapes(self):
+        for shape, dimensions in (('sphere', [4]), ('cone', [4, 3])):
+            voxels = WAnet.preprocessing.voxelize_shape(shape, dimensions, 32)
+            msh = WAnet.meshing.voxels_to_mesh(voxels)
+            coarse = WAnet.meshing.voxels_to_mesh(voxels, target_panels=100)
+            with self.subTest(shape=shape):
+                self.assertEqual(msh.nf > 0, True)
+                self.assertAlmostEqual(numpy.max(msh.Z), 0)
+                self.assertEqual(coarse.nf <= 100 and coarse.nf > 0, True)
+                self.assertEqual(numpy.all(msh.P[-1] == [msh.np - 3, msh.np - 2, msh.np - 1, msh.np]), True)
+        with self.subTest():
+            # Coarsening stops before a small body disappears
+            small = WAnet.meshing.voxels_to_mesh(WAnet.preprocessing.voxelize_shape('sphere', [4], 32), target_panels=1)
+            self.assertEqual(small.nf > 0, True)
+
+    def test_half_mesh(self):
+        # The half of a symmetric body has half its wetted area and nothing below y = 0
+        def area(msh):
+            points = numpy.vstack((msh.X, msh.Y, msh.Z)).T
+            quads = points[numpy.asarray(msh.P) - 1]
+            return 0.5 * numpy.sum(numpy.linalg.norm(numpy.cross(quads[:, 2] - quads[:, 0], quads[:, 3] - quads[:, 1]),
+                                                     axis=1))
+
+        for shape, dimensions, planes in (('box', [5, 4, 3], ['xz', 'yz']), ('cylinder', [5, 4], ['xz']),
+                                          ('sphere', [5], ['xz'])):
+            msh = getattr(WAnet.openwec, shape)(*dimensions, [0, 0, 0])
+            half = WAnet.meshing.half_mesh(msh)
+            with self.subTest(shape=shape):
+                self.assertEqual(WAnet.meshing.symmetries(msh), planes)
+                self.assertAlmostEqual(2 * area(half), area(msh))
+                self.assertEqual(numpy.min(half.Y) >= 0 and half.nf < len(msh.P), True)
+        with self.subTest():
+            msh = WAnet.openwec.box(5, 4, 3, [1, 1, 0])
+            self.assertEqual(WAnet.meshing.symmetries(msh), [])
+
+    def test_symmetric_vertices(self):
+        # Vertices of a mesh solved by halves come back whole
+        case_dir = tempfile.mkdtemp()
+        with open(os.path.join(case_dir, 'axisym.dat'), 'w') as fid:
+            fid.write('          2          1\n')
+            fid.write('             1          1.00          2.00         -1.00\n')
+            fid.write('             2          1.00          0.00         -2.00\n')
+            fid.write('             0          0.00          0.00          0.00\n')
+        vertices = WAnet.preprocessing.read_vertices(case_dir)
+        with self.subTest():
+            self.assertEqual(vertices.shape, (4, 3))
+            self.assertEqual(numpy.any(numpy.all(vertices == [1, -2, -1], axis=1)), True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import numpy
+import WAnet.metrics
+import WAnet.voxels
+
+
+class Model(object):
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.calls = 0
+
+    def predict(self, batch):
+        # Hand back the rows matching this batch
+        start = self.calls
+        self.calls += len(batch)
+        return self.outputs[start:self.calls]
+
+
+class Test(unittest.TestCase):
+
+    def test_mse(self):
+        D, F = 3, 8
+        truth = numpy.random.random((25, D * F))
+        prediction = truth + 0.1 * numpy.random.randn(25, D * F)
+        results = WAnet.metrics.evaluate(Model(prediction), numpy.zeros((25, 4)), truth, 'mse', D, F, batch_size=7,
+                                         dtype=numpy.float64)
+        mse = numpy.mean(numpy.power(prediction - truth, 2))
+        with self.subTest():
+            self.assertAlmostEqual(results['error'], mse)
+            self.assertAlmostEqual(results['r2'], 1 - mse / numpy.var(truth))
+        with self.subTest():
+            per_dof = numpy.power(prediction - truth, 2).reshape((-1, D, F))
+            self.assertEqual(numpy.allclose(results['error_per_dof'], numpy.mean(per_dof, axis=(0, 2))), True)
+            self.assertEqual(numpy.allclose(results['error_per_frequency'], numpy.mean(per_dof, axis=(0, 1))), True)
+            self.assertEqual(numpy.allclose(results['r2_per_dof'], 1 - numpy.mean(per_dof, axis=(0, 2)) /
+                                            numpy.var(truth.reshape((-1, D, F)), axis=(0, 2))), True)
+
+    def test_bce(self):
+        truth = (numpy.random.random((20, 64)) > 0.7).astype(float)
+        prediction = numpy.clip(truth + 0.2 * numpy.random.randn(20, 64), 0, 1)
+        packed = WAnet.voxels.PackedVoxels.from_dense(truth, 4)
+        results = WAnet.metrics.evaluate(Model(prediction), packed, None, 'bce', batch_size=6, dtype=numpy.float64)
+
+        # Full-array version of the trainers' computation
+        bce = numpy.mean(WAnet.metrics.binary_crossentropy(prediction, truth))
+        s2 = numpy.mean(WAnet.metrics.binary_crossentropy(numpy.full(truth.shape, numpy.mean(truth)), truth))
+        with self.subTest():
+            self.assertAlmostEqual(results['error'], bce)
+            self.assertAlmostEqual(results['s2'], s2)
+            self.assertAlmostEqual(results['r2'], 1 - bce / s2)
@@ -0,0 +1,40 @@
+import unittest
+import numpy
+import WAnet.optimizing
+
+
+class Decoder(object):
+    # Each latent value in [-3, 3] fills that fraction of its own block of 600 voxels
+    def predict(self, latents, batch_size=32):
+        filled = numpy.clip((latents + 3) / 6, 0, 1) * 600
+        return (numpy.arange(600)[None, None, :] < filled[:, :, None]).reshape((len(latents), -1)).astype(float)
+
+
+class Forward(object):
+    # Reads the latent values back from the filled voxels, so the loss is a quadratic in latent space
+    def predict(self, geometry, batch_size=32):
+        return numpy.sum(geometry.reshape((len(geometry), -1, 600)), axis=2) / 100 - 3
+
+
+class Test(unittest.TestCase):
+
+    def test_optimize_design(self):
+        # From a start far off with a small step, the step size has to grow and then shrink to reach the optimum
+        target = numpy.array([2.5, -1.0, 0.5])
+        latents, geometry, curves, loss = WAnet.optimizing.optimize_design(target, 3, generations=150, sigma=0.1,
+                                                                            number_of_candidates=5, seed=1,
+                                                                            decoder=Decoder(), forward=Forward())
+        with self.subTest():
+            self.assertEqual(latents.shape, (5, 3))
+            self.assertEqual(geometry.shape, (5, 1800))
+            self.assertEqual(numpy.all(numpy.diff(loss) >= 0), True)
+        with self.subTest():
+            numpy.testing.assert_allclose(latents[0], target, atol=0.02)
+            numpy.testing.assert_allclose(curves[0], target, atol=0.02)
+            self.assertLess(loss[0], 1e-4)
+        with self.subTest():
+            self.assertEqual(numpy.all(numpy.abs(latents) <= 3), True)
+
+
+if __name__ == '__main__':
+    unittest.main()
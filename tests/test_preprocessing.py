@@ -0,0 +1,39 @@
+import unittest
+import os
+import numpy
+import scipy.spatial
+import pkg_resources
+import WAnet.preprocessing
+
+
+class Test(unittest.TestCase):
+
+    def test_voxelize_shape(self):
+        G = 32
+        test_points = WAnet.preprocessing.make_test_points(G)
+        for case in ['box000', 'cylinder000', 'wedge000']:
+            dir_path = pkg_resources.resource_filename('WAnet', os.path.join('data/NEMOH_data', case))
+
+            # Voxelize the NEMOH mesh the way extract_data used to
+            vertices = WAnet.preprocessing.read_vertices(dir_path)
+            within = scipy.spatial.Delaunay(vertices).find_simplex(test_points) >= 0
+            expected = within.reshape((G, G, G)).flatten(order='F')
+
+            dimensions = numpy.loadtxt(dir_path + '/geometry.txt')[1:]
+            output = WAnet.preprocessing.voxelize_shape(case[:-3], dimensions, G)
+            with self.subTest(case=case):
+                self.assertLess(numpy.sum(output != expected), 10)
+
+    def test_voxelize_batch(self):
+        output = WAnet.preprocessing.voxelize_batch([('sphere', [5]), ('box', [4, 4, 4])])
+        self.assertEqual(output.shape, (2, 32768))
+        self.assertEqual(numpy.all(output[1] == WAnet.preprocessing.voxelize_shape('box', [4, 4, 4])), True)
+
+    def test_octree(self):
+        dir_path = pkg_resources.resource_filename('WAnet', 'data/NEMOH_data/sphere000')
+        vertices = WAnet.preprocessing.read_vertices(dir_path)
+        for G in [17, 32, 64]:
+            expected = WAnet.preprocessing._points_in_hull(vertices, WAnet.preprocessing.make_test_points(G))
+            output = WAnet.preprocessing.voxelize_vertices(vertices, G)
+            with self.subTest(G=G):
+                self.assertEqual(numpy.all(output == expected.reshape((G, G, G)).flatten(order='F')), True)
@@ -0,0 +1,55 @@
+import unittest
+import numpy
+import os
+import pkg_resources
+import tempfile
+import WAnet.inference
+import WAnet.quantizing
+
+
+class Test(unittest.TestCase):
+
+    def test_kernel(self):
+        kernel = numpy.random.randn(300, 20).astype(numpy.float32)
+        kernel[:, 3] = 0
+        quantized = WAnet.quantizing.QuantizedKernel.from_float(kernel)
+        x = numpy.random.random((7, 300)).astype(numpy.float32)
+        with self.subTest():
+            self.assertEqual(quantized.values.dtype, numpy.int8)
+            self.assertEqual(numpy.all(numpy.abs(quantized.dequantize() - kernel) <= quantized.scale / 2 + 1e-6), True)
+        with self.subTest():
+            numpy.testing.assert_allclose(quantized.dot(x, block=64), numpy.dot(x, quantized.dequantize()), rtol=1e-4,
+                                          atol=1e-4)
+
+    def test_saved_model(self):
+        weights = pkg_resources.resource_filename('WAnet', 'trained_models/16curve_autoencoder_weights.h5')
+        structure = pkg_resources.resource_filename('WAnet', 'trained_models/16curve_autoencoder_structure.yml')
+        quantized = os.path.join(tempfile.mkdtemp(), 'int8_weights.h5')
+        WAnet.quantizing.quantize_weights(weights, quantized)
+
+        original = WAnet.inference.DenseNetwork(structure, weights)
+        network = WAnet.inference.DenseNetwork(structure, quantized)
+        x = numpy.random.random((100, 192)).astype(numpy.float32)
+        with self.subTest():
+            self.assertLess(WAnet.quantizing._model_bytes(network), WAnet.quantizing._model_bytes(original) / 3)
+        with self.subTest():
+            self.assertLess(numpy.max(numpy.abs(network.predict(x) - original.predict(x))), 0.05)
+
+    def test_accuracy_report(self):
+        # Encoders and decoders are scored through their autoencoder, so every role gets a report row
+        cases = ['16curve_encoder', '16curve_decoder', '16curve_autoencoder']
+        for case in cases:
+            self.addCleanup(os.remove, WAnet.quantizing.quantize(case))
+        curves = numpy.random.random((300, 192)).astype(numpy.float32)
+        rows = WAnet.quantizing.accuracy_report(cases, batch_size=100, data=(None, curves, 32, 3, 64))
+        for case, row in zip(cases, rows):
+            with self.subTest(case=case):
+                self.assertEqual(row['case'], case)
+                self.assertLess(row['int8']['bytes'], row['float32']['bytes'] / 3)
+                self.assertLess(abs(row['int8']['r2'] - row['float32']['r2']), 0.05)
+        with self.subTest():
+            self.assertEqual(len(WAnet.quantizing.table(rows).splitlines()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
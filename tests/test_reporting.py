@@ -0,0 +1,65 @@
+import unittest
+import numpy
+import os
+import pkg_resources
+import shutil
+import tempfile
+import WAnet.reporting
+import WAnet.showing
+
+
+class Test(unittest.TestCase):
+
+    def test_figure_key(self):
+        # A retrained model, other examples or other settings all give a new figure
+        models = tempfile.mkdtemp()
+        for suffix in ('_structure.yml', '_weights.h5'):
+            shutil.copy(pkg_resources.resource_filename('WAnet', 'trained_models/16curve_autoencoder'+suffix), models)
+        settings = {'nx': 2, 'ny': 3, 'quick': True, 'renderer': 'faces', 'dpi': 300}
+        key = WAnet.reporting.figure_key('16curve_autoencoder', [1, 2, 3], settings, models)
+        with self.subTest():
+            self.assertEqual(WAnet.reporting.figure_key('16curve_autoencoder', numpy.array([1, 2, 3]), dict(settings),
+                                                        models), key)
+            self.assertNotEqual(WAnet.reporting.figure_key('16curve_autoencoder', [1, 2, 4], settings, models), key)
+            self.assertNotEqual(WAnet.reporting.figure_key('16curve_autoencoder', [1, 2, 3], dict(settings, dpi=100),
+                                                           models), key)
+        with open(os.path.join(models, '16curve_autoencoder_weights.h5'), 'ab') as file:
+            file.write(b'\0')
+        with self.subTest():
+            self.assertNotEqual(WAnet.reporting.figure_key('16curve_autoencoder', [1, 2, 3], settings, models), key)
+
+    def test_build_report(self):
+        # Figures are rendered once and reused while nothing changes
+        rendered = []
+
+        def plot_examples(case, nx, ny, quick=True, renderer='faces', dpi=1000, indices=None, filename=None):
+            rendered.append(case)
+            open(filename, 'w').close()
+
+        original = WAnet.showing.plot_examples
+        WAnet.showing.plot_examples = plot_examples
+        self.addCleanup(setattr, WAnet.showing, 'plot_examples', original)
+
+        directory = tempfile.mkdtemp()
+        cases = ('curve_autoencoder', 'curve_encoder')
+        figures = WAnet.reporting.build_report(cases, (2, 16), indices=[1, 2, 3, 4, 5, 6], processes=1,
+                                               directory=directory)
+        with self.subTest():
+            self.assertEqual(sorted(rendered), ['16curve_autoencoder', '16curve_encoder', '2curve_autoencoder',
+                                                '2curve_encoder'])
+            self.assertEqual(all(os.path.exists(filename) for case, filename in figures), True)
+        with open(os.path.join(directory, 'index.html')) as file:
+            page = file.read()
+        with self.subTest():
+            self.assertEqual(all(os.path.basename(filename) in page for case, filename in figures), True)
+        WAnet.reporting.build_report(cases, (2, 16), indices=[1, 2, 3, 4, 5, 6], processes=1, directory=directory)
+        with self.subTest():
+            self.assertEqual(len(rendered), 4)
+        WAnet.reporting.build_report(cases, (2,), indices=[1, 2, 3, 4, 5, 6], dpi=100, processes=1,
+                                     directory=directory)
+        with self.subTest():
+            self.assertEqual(len(rendered), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import numpy
+import WAnet.preprocessing
+import WAnet.sampling
+
+
+class Evaluator(object):
+    # Spreads and reconstruction errors looked up by the first dimension of each candidate
+    G = 8
+
+    def __init__(self, spread, reconstruction):
+        self.spread = spread
+        self.reconstruction = reconstruction
+
+    def score(self, geometry, batch_size=1000):
+        return numpy.zeros((len(geometry), 6)), numpy.array(self.spread), numpy.array(self.reconstruction)
+
+
+class Test(unittest.TestCase):
+
+    def test_draw_candidates(self):
+        shapes = list(WAnet.preprocessing.GEOMETRIES)
+        candidates = WAnet.sampling.draw_candidates(3 * len(shapes), numpy.random.RandomState(0))
+        with self.subTest():
+            self.assertEqual([shape for shape, dimensions in candidates], 3 * shapes)
+        for shape, dimensions in candidates:
+            limits = list(WAnet.preprocessing.GEOMETRIES[shape]["vars"].values())
+            with self.subTest(shape=shape):
+                self.assertEqual(len(dimensions), len(limits))
+                self.assertEqual(all(low <= value <= high for value, (low, high) in zip(dimensions, limits)), True)
+
+    def test_select_candidates(self):
+        # By spread first, reconstruction error breaking ties, cut to the batch size
+        candidates = [('box', [2 + i, 4, 3]) for i in range(5)]
+        evaluator = Evaluator([0.1, 0.3, 0.3, 0.2, 0.0], [0.5, 0.1, 0.2, 0.9, 0.9])
+        selected, spread = WAnet.sampling.select_candidates(evaluator, candidates, 3)
+        with self.subTest():
+            self.assertEqual(selected, [candidates[2], candidates[1], candidates[3]])
+            numpy.testing.assert_allclose(spread, [0.3, 0.3, 0.2])
+
+
+if __name__ == '__main__':
+    unittest.main()
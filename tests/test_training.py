@@ -0,0 +1,35 @@
+import unittest
+import numpy
+import WAnet.training
+
+
+class Test(unittest.TestCase):
+
+    def test_frozen_layers(self):
+        # Pretrained layers reused by the forward and inverse networks keep their weights through training
+        G, D, F, latent_dim = 8, 2, 3, 2
+        geometry = (numpy.random.random((16, G * G * G)) > 0.5).astype(numpy.float32)
+        curves = numpy.random.random((16, D * F)).astype(numpy.float32)
+        for architecture in ('dense', 'conv'):
+            geo_models = dict(WAnet.training.build_geometry_vae(latent_dim, G, architecture)[1])
+            curve_models = dict(WAnet.training.build_response_vae(latent_dim, D, F)[1])
+            for build, geo, curve, x, y in ((WAnet.training.build_forward_network, geo_models['geometry_encoder'],
+                                             curve_models['curve_decoder'], geometry, curves),
+                                            (WAnet.training.build_inverse_network, geo_models['geometry_decoder'],
+                                             curve_models['curve_encoder'], curves, geometry)):
+                mdl = build(latent_dim, G, D, F, geo, curve)[0]
+                before = [weights.copy() for weights in geo.get_weights() + curve.get_weights()]
+                layers = [layer for layer in mdl.layers if not layer.trainable and layer.weights]
+                frozen = [layer.get_weights() for layer in layers]
+                mdl.fit(x, y, epochs=2, batch_size=4, verbose=0)
+                with self.subTest(architecture=architecture, network=build.__name__):
+                    for old, new in zip(before, geo.get_weights() + curve.get_weights()):
+                        numpy.testing.assert_array_equal(old, new)
+                    self.assertEqual(len(layers), 4 if architecture == 'dense' else 3)
+                    for old, layer in zip(frozen, layers):
+                        for a, b in zip(old, layer.get_weights()):
+                            numpy.testing.assert_array_equal(a, b)
+
+
+if __name__ == '__main__':
+    unittest.main()
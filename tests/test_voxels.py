@@ -0,0 +1,110 @@
+import unittest
+import numpy
+import os
+import sklearn.model_selection
+import sklearn.model_selection
+import tempfile
+import WAnet.voxels
+
+
+class Test(unittest.TestCase):
+
+    def test_packed_voxels(self):
+        dense = (numpy.random.random((10, 64)) > 0.5).astype(float)
+        packed = WAnet.voxels.PackedVoxels.from_dense(dense, 4)
+        with self.subTest():
+            self.assertEqual(packed.shape, (10, 64))
+            self.assertEqual(packed.nbytes, 80)
+        with self.subTest():
+            self.assertEqual(numpy.all(packed.unpack() == dense), True)
+        with self.subTest():
+            self.assertEqual(numpy.all(packed[3:7].unpack() == dense[3:7]), True)
+            self.assertEqual(numpy.all(packed[numpy.array([1, 8])].unpack() == dense[[1, 8]]), True)
+            self.assertEqual(numpy.all(packed[2:5, :].unpack() == dense[2:5]), True)
+            self.assertEqual(numpy.all(packed[numpy.array([1, 8]), ...].unpack() == dense[[1, 8]]), True)
+        with self.subTest():
+            with self.assertRaises(IndexError):
+                packed[:, :10]
+            with self.assertRaises(IndexError):
+                packed[0, 3]
+        with self.subTest():
+            self.assertEqual(numpy.all(numpy.vstack(list(packed.batches(3))) == dense), True)
+
+    def test_exposed_faces(self):
+        # A lone cell shows all six faces, two touching cells hide the pair between them
+        matrix = numpy.zeros((3, 3, 3))
+        matrix[1, 1, 1] = 1
+        corners, normals = WAnet.voxels.exposed_faces(matrix)
+        with self.subTest():
+            self.assertEqual(corners.shape, (6, 4, 3))
+            self.assertEqual(numpy.all(corners.min(axis=(0, 1)) == 1) and numpy.all(corners.max(axis=(0, 1)) == 2), True)
+            self.assertEqual(numpy.all(numpy.sum(normals, axis=0) == 0), True)
+        matrix[1, 1, 2] = 1
+        corners, normals = WAnet.voxels.exposed_faces(matrix)
+        with self.subTest():
+            self.assertEqual(len(corners), 10)
+        with self.subTest():
+            # Faces of a solid block are its surface area
+            self.assertEqual(len(WAnet.voxels.exposed_faces(numpy.ones((4, 5, 6)))[0]), 2 * (20 + 24 + 30))
+
+    def test_voxel_mask(self):
+        # Voxel 0 is always empty, voxel 1 always full, the rest vary
+        dense = (numpy.random.random((20, 64)) > 0.5).astype(float)
+        dense[:, 0] = 0
+        dense[:, 1] = 1
+        dense[0, 2:] = 0
+        dense[1, 2:] = 1
+        packed = WAnet.voxels.PackedVoxels.from_dense(dense, 4)
+        mask = WAnet.voxels.VoxelMask.from_data(packed, 4, batch_size=6)
+        with self.subTest():
+            self.assertEqual(mask.size, 62)
+            self.assertEqual(numpy.all(mask.expand(mask.compress(packed)) == dense), True)
+        with self.subTest():
+            filename = os.path.join(tempfile.mkdtemp(), 'mask.npz')
+            mask.save(filename)
+            loaded = WAnet.voxels.load_mask(filename)
+            self.assertEqual(numpy.all(loaded.active == mask.active) and numpy.all(loaded.fill == mask.fill), True)
+        masked = WAnet.voxels.MaskedVoxels(packed.packed, 4, mask)
+        with self.subTest():
+            self.assertEqual(masked.shape, (20, 62))
+            self.assertEqual(numpy.all(masked[3:7].unpack() == dense[3:7, 2:]), True)
+            self.assertEqual(numpy.all(numpy.vstack(list(WAnet.voxels.batches(masked, 6))) == dense[:, 2:]), True)
+
+    def test_masked_model(self):
+        # An autoencoder of the active voxels only, seen as one of the full grid
+        mask = WAnet.voxels.VoxelMask(numpy.arange(8) > 3, numpy.arange(8) == 0, 2)
+
+        class Identity(object):
+            input_shape = (None, 4)
+            output_shape = (None, 4)
+
+            def predict(self, x, batch_size=32):
+                return x
+
+        model = WAnet.voxels.MaskedModel(Identity(), mask)
+        x = numpy.random.random((3, 8))
+        y = model.predict(x)
+        with self.subTest():
+            self.assertEqual(model.input_shape, (None, 8))
+            self.assertEqual(numpy.all(y[:, 4:] == x[:, 4:]), True)
+            self.assertEqual(numpy.all(y[:, 0] == 1) and numpy.all(y[:, 1:4] == 0), True)
+
+    def test_train_test_split(self):
+        # sklearn splits packed and masked voxels by rows, as Trainer.split does, with and without targets
+        dense = (numpy.random.random((20, 64)) > 0.5).astype(float)
+        dense[:, 0] = 1
+        mask = WAnet.voxels.VoxelMask.from_data(dense, 4)
+        y = numpy.arange(20)
+        for voxels in (WAnet.voxels.PackedVoxels.from_dense(dense, 4),
+                       WAnet.voxels.MaskedVoxels(WAnet.voxels.pack(dense), 4, mask)):
+            expected = dense if type(voxels) is WAnet.voxels.PackedVoxels else dense[:, mask.active]
+            x_train, x_test, y_train, y_test = sklearn.model_selection.train_test_split(voxels, y, test_size=0.25,
+                                                                                        shuffle=False)
+            with self.subTest(type=type(voxels).__name__):
+                self.assertEqual(type(x_train), type(voxels))
+                self.assertEqual(numpy.all(x_test.unpack() == expected[15:]), True)
+                self.assertEqual(y_test.tolist(), list(range(15, 20)))
+            x_train, x_test = sklearn.model_selection.train_test_split(voxels, test_size=0.25, random_state=0)
+            with self.subTest(type=type(voxels).__name__, y=None):
+                self.assertEqual((len(x_train), len(x_test)), (15, 5))
+                self.assertEqual(x_test.shape[1], expected.shape[1])